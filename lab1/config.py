@@ -4,3 +4,11 @@ IMAGE_PATHS = [
     "source/img3.jpg",
     "source/img.jpg"
 ]
+
+# Средний цвет: True — по уменьшенному при декодировании JPEG (Image.draft), быстро и приблизительно
+FAST_AVERAGE = False
+DRAFT_SCALE = 8
+
+# Предзагрузка: картинки декодируются и масштабируются под экран в фоне
+PREFETCH_WORKERS = 2
+PREFETCH_MB = 256
@@ -1,8 +1,27 @@
+import os
 import tkinter as tk
-from tkinter import ttk
-from PIL import Image, ImageTk
+from functools import lru_cache
+from tkinter import messagebox, ttk
+from PIL import Image, ImageStat
 
-from config import IMAGE_PATHS
+from config import DRAFT_SCALE, FAST_AVERAGE, IMAGE_PATHS, PREFETCH_MB, PREFETCH_WORKERS
+from prefetch import PrefetchCache
+
+
+@lru_cache(maxsize=64)
+def _average_rgb(path, mtime_ns, fast):
+    with Image.open(path) as img:
+        if fast:
+            # JPEG декодируется сразу в 1/2..1/8 размера — в разы меньше работы
+            img.draft("RGB", (max(1, img.width // DRAFT_SCALE), max(1, img.height // DRAFT_SCALE)))
+        # ImageStat считает среднее по гистограмме в C, без кортежа на каждый пиксель
+        r, g, b = ImageStat.Stat(img.convert("RGB")).mean
+    return r, g, b
+
+
+def average_rgb(path, fast=FAST_AVERAGE):
+    """Средний цвет исходника в родном разрешении; кэшируется по пути и времени изменения файла"""
+    return _average_rgb(os.path.abspath(path), os.stat(path).st_mtime_ns, fast)
 
 
 class ImageApp:
@@ -28,23 +47,40 @@ class ImageApp:
         self.canvas = tk.Canvas(root, width=300, height=200, bg="white")
         self.canvas.place(relx=1.0, rely=1.0, x=-10, y=-10, anchor="se")
 
-    def show_image(self, path):
-        img = Image.open(path)
-        img = img.resize((self.screen_width, self.screen_height), Image.LANCZOS)
-        self.photo = ImageTk.PhotoImage(img)
+        # Все картинки готовятся заранее, кнопка только подменяет PhotoImage
+        self.cache = PrefetchCache((self.screen_width, self.screen_height), average_rgb,
+                                   PREFETCH_MB * 2 ** 20, PREFETCH_WORKERS, on_error=self.report_error)
+        self._poll_id = None
+        for path in IMAGE_PATHS:
+            self.cache.prefetch(path)
+        self.poll_prefetch()
+        root.protocol("WM_DELETE_WINDOW", self.close)
 
-        self.image_label.configure(image=self.photo)
+    def report_error(self, path, exc):
+        messagebox.showerror("Ошибка загрузки", f"Не удалось загрузить {path}:\n{exc}")
 
-        r, g, b = self.get_average_rgb(img)
+    def close(self):
+        self.cache.shutdown()
+        self.root.destroy()
 
-        self.draw_chart(r, g, b)
+    def poll_prefetch(self):
+        if self._poll_id is not None:
+            self.root.after_cancel(self._poll_id)
+        self._poll_id = self.root.after(50, self.poll_prefetch) if self.cache.poll() else None
 
-    def get_average_rgb(self, img):
-        pixels = list(img.getdata())
-        r = sum(p[0] for p in pixels) / len(pixels)
-        g = sum(p[1] for p in pixels) / len(pixels)
-        b = sum(p[2] for p in pixels) / len(pixels)
-        return r, g, b
+    def show_image(self, path):
+        try:
+            self.photo, (r, g, b) = self.cache.get(path)
+        except Exception as e:
+            self.report_error(path, e)
+            return
+        self.image_label.configure(image=self.photo)
+
+        self.draw_chart(r, g, b)
+        # файл мог измениться — тогда get() пересчитал его; остальные готовые проверяем в фоне
+        # (вытесненные не трогаем, иначе каждый щелчок гонял бы весь набор через LRU)
+        self.cache.refresh()
+        self.poll_prefetch()
 
     def draw_chart(self, r, g, b):
         self.canvas.delete("all")
@@ -0,0 +1,105 @@
+import os
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image, ImageTk
+
+
+def load_scaled(path, size, stats_fn):
+    """Выполняется в потоке пула: декодирует, масштабирует под экран и считает статистику"""
+    with Image.open(path) as img:
+        # JPEG сразу декодируется в уменьшенном виде (но не меньше size), LANCZOS доводит до точного размера
+        img.draft("RGB", size)
+        img = img.convert("RGB").resize(size, Image.LANCZOS)
+    return img, stats_fn(path)
+
+
+class PrefetchCache:
+    """Готовые к показу PhotoImage для набора файлов.
+
+    Декодирование и ресайз идут в пуле потоков; PhotoImage создаётся только в потоке Tk (poll/get).
+    Запись устаревает, если у файла изменилось время модификации.
+    Ошибки фоновой загрузки передаются в on_error(path, exc) — тоже в потоке Tk.
+    """
+
+    def __init__(self, size, stats_fn, max_bytes, workers=2, on_error=None):
+        self.size = size
+        self.stats_fn = stats_fn
+        self.on_error = on_error
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._pending = {}  # path -> (mtime, future)
+        self._ready = OrderedDict()  # path -> (mtime, photo, stats)
+
+    def _entry_bytes(self):
+        # Tk хранит фото как 4 байта на пиксель
+        return self.size[0] * self.size[1] * 4
+
+    def _report(self, path, exc):
+        if self.on_error is not None:
+            self.on_error(path, exc)
+
+    def prefetch(self, path):
+        """Ставит файл в очередь загрузки, если его нет среди готовых или он изменился"""
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError as e:
+            # файл пропал — готовая запись больше не нужна, и refresh не будет жаловаться снова
+            if self._ready.pop(path, None) is not None:
+                self.bytes -= self._entry_bytes()
+            self._report(path, e)
+            return
+        ready = self._ready.get(path)
+        if ready is not None and ready[0] == mtime:
+            return
+        pending = self._pending.get(path)
+        if pending is not None and pending[0] == mtime:
+            return
+        self._pending[path] = (mtime, self._pool.submit(load_scaled, path, self.size, self.stats_fn))
+
+    def _store(self, path, mtime, img, stats):
+        if path in self._ready:
+            del self._ready[path]
+            self.bytes -= self._entry_bytes()
+        self._ready[path] = (mtime, ImageTk.PhotoImage(img), stats)
+        self.bytes += self._entry_bytes()
+        while self.bytes > self.max_bytes and len(self._ready) > 1:
+            self._ready.popitem(last=False)
+            self.bytes -= self._entry_bytes()
+
+    def poll(self):
+        """Переносит готовые результаты пула в PhotoImage; True — если что-то ещё в работе"""
+        for path, (mtime, fut) in list(self._pending.items()):
+            if fut.done():
+                del self._pending[path]
+                if fut.exception() is not None:
+                    self._report(path, fut.exception())
+                    continue
+                img, stats = fut.result()
+                self._store(path, mtime, img, stats)
+        return bool(self._pending)
+
+    def refresh(self):
+        """Перепроверяет готовые записи; вытесненные из кэша заново не грузятся"""
+        for path in list(self._ready):
+            self.prefetch(path)
+
+    def get(self, path):
+        """(PhotoImage, статистика); если файл ещё не готов — дожидается его.
+
+        Исключение загрузки (нет файла, битый файл) пробрасывается вызывающему.
+        """
+        os.stat(path)  # нет файла — OSError сразу, а не KeyError ниже
+        self.prefetch(path)
+        pending = self._pending.pop(path, None)
+        if pending is not None:
+            mtime, fut = pending
+            img, stats = fut.result()
+            self._store(path, mtime, img, stats)
+        self._ready.move_to_end(path)
+        _, photo, stats = self._ready[path]
+        return photo, stats
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -1,3 +1,6 @@
 # filters/__init__.py
 from .base import FilterRegistry
 from . import basic_filters, enhance_filters, special_filters  # noqa
+from .engine import apply_chain, describe_plan, plan_chain, run_plan, scale_params
+from .cache import ChainCache
+from .tiled import run_tiled
@@ -1,10 +1,44 @@
+import inspect
+
+import numpy as np
+
+
 class FilterRegistry:
     _filters = {}
+    _kernels = {}
+    _points = {}
+    _spatial = set()
+    _footprints = {}
 
     @classmethod
-    def register(cls, name):
+    def register(cls, name, spatial=(), footprint=0):
+        """spatial — параметры, измеряемые в пикселях (их надо масштабировать вместе с картинкой);
+        footprint — на сколько пикселей фильтр смотрит в стороны: число или func(**params)
+        """
         def decorator(func):
             cls._filters[name] = func
+            cls._spatial.update(spatial)
+            cls._footprints[name] = footprint
+            return func
+        return decorator
+
+    @classmethod
+    def register_kernel(cls, name):
+        """Регистрирует массивное ядро фильтра: (H, W, 3) uint8 -> (H, W, 3) uint8"""
+        def decorator(func):
+            cls._kernels[name] = func
+            return func
+        return decorator
+
+    @classmethod
+    def register_point(cls, name):
+        """Поточечный фильтр: func(**params) возвращает LutOp или MatrixOp.
+
+        Планировщик сливает такие фильтры в один проход; ядро строится из того же описания.
+        """
+        def decorator(func):
+            cls._points[name] = func
+            cls._kernels[name] = lambda arr, **params: func(**params)(arr)
             return func
         return decorator
 
@@ -12,6 +46,37 @@ class FilterRegistry:
     def get_filters(cls):
         return cls._filters
 
+    @classmethod
+    def get_kernel(cls, name):
+        return cls._kernels.get(name)
+
+    @classmethod
+    def get_point(cls, name):
+        return cls._points.get(name)
+
+    @classmethod
+    def param_defaults(cls, name):
+        """Параметры, которые фильтр реально читает, со значениями по умолчанию"""
+        func = cls._filters.get(name)
+        if func is None:
+            return {}
+        params = list(inspect.signature(func).parameters.values())[1:]
+        return {p.name: p.default for p in params if p.kind is not p.VAR_KEYWORD}
+
+    @classmethod
+    def footprint(cls, name, params):
+        fp = cls._footprints.get(name, 0)
+        return fp(**params) if callable(fp) else fp
+
+    @classmethod
+    def spatial_params(cls):
+        return set(cls._spatial)
+
     @classmethod
     def names(cls):
         return list(cls._filters.keys())
+
+
+def make_lut(fn):
+    """Таблица на 256 значений канала; fn вызывается с тем же int, что и в попиксельной версии"""
+    return np.array([fn(v) for v in range(256)], dtype=np.uint8)
@@ -1,5 +1,22 @@
+import numpy as np
 from PIL import Image, ImageOps
-from .base import FilterRegistry
+from .base import FilterRegistry, make_lut
+from .pointops import LutOp, MatrixOp
+
+# та же целочисленная формула, что у PIL при convert("L"): (r*19595 + g*38470 + b*7471 + 0x8000) >> 16;
+# веса — двоичные дроби, поэтому в float64 сумма считается без погрешности
+_GRAY_ROW = (19595 / 65536, 38470 / 65536, 7471 / 65536, 0.5)
+
+SEPIA_MATRIX = (
+    (0.393, 0.769, 0.189, 0.0),
+    (0.349, 0.686, 0.168, 0.0),
+    (0.272, 0.534, 0.131, 0.0),
+)
+
+
+@FilterRegistry.register_point("Grayscale")
+def p_grayscale(**_):
+    return MatrixOp((_GRAY_ROW,) * 3)
 
 
 @FilterRegistry.register("Grayscale")
@@ -7,6 +24,11 @@ def f_grayscale(img, **_):
     return ImageOps.grayscale(img).convert("RGB")
 
 
+@FilterRegistry.register_point("Invert")
+def p_invert(**_):
+    return LutOp(255 - np.arange(256))
+
+
 @FilterRegistry.register("Invert")
 def f_invert(img, **_):
     if img.mode == "RGBA":
@@ -17,18 +39,22 @@ def f_invert(img, **_):
     return ImageOps.invert(img)
 
 
+@FilterRegistry.register_point("Sepia")
+def p_sepia(**_):
+    return MatrixOp(SEPIA_MATRIX)
+
+
 @FilterRegistry.register("Sepia")
 def f_sepia(img, **_):
-    img = img.convert("RGB")
-    pixels = img.load()
-    for y in range(img.height):
-        for x in range(img.width):
-            r, g, b = pixels[x, y]
-            tr = int(0.393 * r + 0.769 * g + 0.189 * b)
-            tg = int(0.349 * r + 0.686 * g + 0.168 * b)
-            tb = int(0.272 * r + 0.534 * g + 0.131 * b)
-            pixels[x, y] = (min(255, tr), min(255, tg), min(255, tb))
-    return img
+    arr = np.asarray(img.convert("RGB"))
+    return Image.fromarray(p_sepia()(arr))
+
+
+@FilterRegistry.register_point("Posterize")
+def p_posterize(posterize_bits=4, **_):
+    bits = max(1, min(int(posterize_bits), 8))
+    mask = ~(2 ** (8 - bits) - 1)
+    return LutOp(make_lut(lambda v: v & mask))
 
 
 @FilterRegistry.register("Posterize")
@@ -0,0 +1,130 @@
+import argparse
+import glob
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from PIL import Image
+
+from .base import FilterRegistry
+from .engine import apply_chain
+from .tiled import open_source, run_tiled
+
+
+def parse_value(text):
+    for cast in (int, float):
+        try:
+            return cast(text)
+        except ValueError:
+            pass
+    return text
+
+
+def glob_root(pattern):
+    """Часть маски до первого элемента с *, ? или [ — от неё отсчитываются пути результатов"""
+    parts = []
+    for part in os.path.normpath(pattern).split(os.sep):
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    else:
+        parts.pop()  # маска без подстановок — это сам файл
+    return os.sep.join(parts) or (os.sep if os.path.isabs(pattern) else os.curdir)
+
+
+def output_path(src, root, out_dir):
+    """Путь результата: src относительно root внутри out_dir (одноимённые файлы из разных папок не совпадут)"""
+    return os.path.join(out_dir, os.path.relpath(src, root))
+
+
+def process_one(src, dst, names, params):
+    """Выполняется в процессе-воркере: читает, фильтрует и сразу пишет результат"""
+    t0 = time.perf_counter()
+    with Image.open(src) as img:
+        result = apply_chain(img, names, params)
+    os.makedirs(os.path.dirname(dst) or os.curdir, exist_ok=True)
+    result.save(dst)
+    return dst, result.width * result.height, time.perf_counter() - t0
+
+
+def run_batch(paths, out_dir, names, params, workers=None, root=None):
+    """root — общий корень входных файлов (glob_root маски); по умолчанию их общая папка"""
+    if root is None:
+        root = os.path.commonpath([os.path.dirname(os.path.abspath(p)) for p in paths])
+    os.makedirs(out_dir, exist_ok=True)
+    total_px = 0
+    done = 0
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_one, p, output_path(os.path.abspath(p), os.path.abspath(root), out_dir),
+                               names, params): p for p in paths}
+        for fut in as_completed(futures):
+            src = futures[fut]
+            try:
+                dst, px, dt = fut.result()
+            except Exception as e:
+                print(f"  ошибка: {src}: {e}")
+                continue
+            done += 1
+            total_px += px
+            print(f"  [{done}/{len(paths)}] {src} -> {dst}  {px / 1e6:.1f} MP за {dt:.2f} с "
+                  f"({px / 1e6 / dt:.1f} MP/s)")
+    elapsed = time.perf_counter() - t0
+    print(f"Готово: {done} из {len(paths)} за {elapsed:.2f} с — "
+          f"{done / elapsed:.2f} изобр./с, {total_px / 1e6 / elapsed:.1f} MP/s")
+    return done
+
+
+def add_chain_args(parser):
+    parser.add_argument("-c", "--chain", required=True,
+                        help="фильтры через запятую: " + ",".join(FilterRegistry.names()))
+    parser.add_argument("-p", "--param", action="append", default=[], metavar="KEY=VALUE",
+                        help="параметр фильтра, например brightness=1.2 (можно несколько раз)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m filters")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    batch = sub.add_parser("batch", help="применить цепочку фильтров к набору картинок")
+    batch.add_argument("pattern", help='маска входных файлов, например "source/*.jpg"')
+    add_chain_args(batch)
+    batch.add_argument("-o", "--out", default="out", help="папка для результатов")
+    batch.add_argument("-j", "--workers", type=int, default=None, help="число процессов (по умолчанию — все ядра)")
+
+    tiled = sub.add_parser("tiled", help="обработать огромную картинку по тайлам с ограниченной памятью")
+    tiled.add_argument("src", help=".npy / .ppm читаются через memmap, остальные форматы — целиком")
+    tiled.add_argument("dst", help="результат: .npy или .ppm, пишется по мере готовности тайлов")
+    add_chain_args(tiled)
+    tiled.add_argument("-t", "--tile", type=int, default=1024, help="сторона тайла в пикселях")
+    tiled.add_argument("-j", "--workers", type=int, default=4, help="число потоков")
+
+    args = parser.parse_args(argv)
+
+    names = [n.strip() for n in args.chain.split(",") if n.strip()]
+    unknown = [n for n in names if n not in FilterRegistry.get_filters()]
+    if unknown:
+        parser.error(f"неизвестные фильтры: {', '.join(unknown)}")
+
+    params = {}
+    for item in args.param:
+        key, sep, value = item.partition("=")
+        if not sep:
+            parser.error(f"параметр должен иметь вид KEY=VALUE: {item}")
+        params[key.strip()] = parse_value(value.strip())
+
+    if args.command == "tiled":
+        src = open_source(args.src)
+        t0 = time.perf_counter()
+        run_tiled(src, args.dst, names, params, args.tile, args.workers)
+        elapsed = time.perf_counter() - t0
+        px = src.shape[0] * src.shape[1]
+        print(f"{args.src} -> {args.dst}: {px / 1e6:.1f} MP за {elapsed:.2f} с ({px / 1e6 / elapsed:.1f} MP/s)")
+        return
+
+    paths = sorted(glob.glob(args.pattern, recursive=True))
+    if not paths:
+        parser.error(f"по маске {args.pattern} ничего не найдено")
+
+    print(f"Файлов: {len(paths)}, цепочка: {' -> '.join(names)}, параметры: {params}")
+    run_batch(paths, args.out, names, params, args.workers, glob_root(args.pattern))
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+
+from .base import FilterRegistry
+from .engine import plan_chain, run_plan
+
+
+def prefix_keys(names, params, source=None):
+    """keys[i] — ключ результата names[:i + 1]: источник, имена и только используемые параметры"""
+    keys = []
+    key = (source,)
+    for name in names:
+        used = FilterRegistry.param_defaults(name)
+        key = key + ((name, tuple((p, params.get(p, d)) for p, d in sorted(used.items()))),)
+        keys.append(key)
+    return keys
+
+
+class ChainCache:
+    """LRU-кэш промежуточных картинок цепочки с ограничением по байтам.
+
+    Для каждого источника помнится последняя цепочка (по ней режется план); источников
+    держится не больше max_sources, самый давний забывается первым.
+    """
+
+    def __init__(self, max_bytes, max_sources=8):
+        self.max_bytes = max_bytes
+        self.max_sources = max_sources
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_filters = 0
+        self._items = OrderedDict()
+        self._last_keys = OrderedDict()
+
+    @staticmethod
+    def _size(img):
+        return img.width * img.height * len(img.getbands())
+
+    def get(self, key):
+        img = self._items.get(key)
+        if img is not None:
+            self._items.move_to_end(key)
+        return img
+
+    def put(self, key, img):
+        size = self._size(img)
+        if size > self.max_bytes:
+            return
+        if key in self._items:
+            self.bytes -= self._size(self._items.pop(key))
+        self._items[key] = img
+        self.bytes += size
+        while self.bytes > self.max_bytes:
+            _, old = self._items.popitem(last=False)
+            self.bytes -= self._size(old)
+            self.evictions += 1
+
+    def clear(self):
+        self._items.clear()
+        self.bytes = 0
+        self._last_keys.clear()
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, evictions=self.evictions,
+                    reused_filters=self.reused_filters, entries=len(self._items),
+                    mb=round(self.bytes / 2 ** 20, 1), max_mb=round(self.max_bytes / 2 ** 20, 1))
+
+    def run(self, original, names, params, source=None):
+        """Применяет цепочку, начиная с самого длинного закэшированного префикса.
+
+        source отличает разные входные картинки (полное разрешение, превью нужного размера).
+        Возвращает (картинка, список выполненных шагов плана).
+        """
+        keys = prefix_keys(names, params, source)
+        start, img = 0, original
+        for k in range(len(keys), 0, -1):
+            hit = self.get(keys[k - 1])
+            if hit is not None:
+                start, img = k, hit
+                break
+        if names:
+            if start:
+                self.hits += 1
+                self.reused_filters += start
+            else:
+                self.misses += 1
+
+        # режем план на первом изменившемся фильтре, чтобы его вход попал в кэш:
+        # следующий сдвиг того же слайдера перезапустит только хвост цепочки
+        last = self._last_keys.pop(source, [])
+        dirty = 0
+        while dirty < min(len(keys), len(last)) and keys[dirty] == last[dirty]:
+            dirty += 1
+        self._last_keys[source] = keys
+        while len(self._last_keys) > self.max_sources:
+            self._last_keys.popitem(last=False)
+        bounds = sorted({start, max(start, dirty), len(names)})
+
+        executed = []
+        pos = start
+        for a, b in zip(bounds, bounds[1:]):
+            for step in plan_chain(names[a:b], params):
+                img = run_plan(img, [step], params)
+                pos += len(step.names)
+                self.put(keys[pos - 1], img)
+                executed.append(step)
+        if not executed and img is original:
+            img = original.copy()
+        return img, executed
@@ -0,0 +1,84 @@
+import numpy as np
+from PIL import Image
+
+from .base import FilterRegistry
+from .pointops import PointStage
+
+
+class PlanStep:
+    """Один проход по изображению.
+
+    kind: "point" — слитые поточечные фильтры (op — PointStage),
+          "kernel" — массивное ядро, "pil" — PIL-функция фильтра.
+    """
+
+    def __init__(self, kind, names, op):
+        self.kind = kind
+        self.names = names
+        self.op = op
+
+
+def plan_chain(names, params):
+    """Строит план: соседние поточечные фильтры сливаются в одну стадию"""
+    plan = []
+    for name in names:
+        point = FilterRegistry.get_point(name)
+        if point:
+            op = point(**params)
+            last = plan[-1] if plan else None
+            if last is not None and last.kind == "point" and last.op.push(op):
+                last.names.append(name)
+            else:
+                plan.append(PlanStep("point", [name], PointStage([op])))
+            continue
+        kernel = FilterRegistry.get_kernel(name)
+        if kernel:
+            plan.append(PlanStep("kernel", [name], kernel))
+            continue
+        func = FilterRegistry.get_filters().get(name)
+        if func:
+            plan.append(PlanStep("pil", [name], func))
+    return plan
+
+
+def describe_plan(plan, executed=None):
+    """План цепочки построчно; executed — шаги, реально выполненные (остальное взято из кэша)"""
+    n_filters = sum(len(step.names) for step in plan)
+    lines = [f"Фильтров: {n_filters}, проходов: {len(plan)} (убрано {n_filters - len(plan)})"]
+    for i, step in enumerate(plan, 1):
+        how = step.op.describe() if step.kind == "point" else step.kind
+        lines.append(f"  {i}. {' + '.join(step.names)}  [{how}]")
+    if executed is not None:
+        n_run = sum(len(step.names) for step in executed)
+        lines.append(f"Выполнено: проходов {len(executed)}, фильтров {n_run}; "
+                     f"из кэша фильтров {n_filters - n_run}")
+    return "\n".join(lines)
+
+
+def run_plan(img, plan, params):
+    """Выполняет план; в PIL картинка переводится только перед PIL-шагом"""
+    img = img.convert("RGB")
+    arr = None
+    for step in plan:
+        if step.kind == "pil":
+            if arr is not None:
+                img, arr = Image.fromarray(arr), None
+            img = step.op(img, **params)
+            continue
+        if arr is None:
+            arr = np.asarray(img)
+        arr = step.op(arr) if step.kind == "point" else step.op(arr, **params)
+    if arr is not None:
+        img = Image.fromarray(arr)
+    return img
+
+
+def scale_params(params, scale):
+    """Параметры для копии картинки в масштабе scale: пиксельные величины тоже масштабируются"""
+    spatial = FilterRegistry.spatial_params()
+    return {k: v * scale if k in spatial else v for k, v in params.items()}
+
+
+def apply_chain(img, names, params):
+    """Применяет цепочку фильтров за минимальное число проходов"""
+    return run_plan(img, plan_chain(names, params), params)
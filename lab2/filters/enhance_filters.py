@@ -1,41 +1,38 @@
-from PIL import ImageEnhance, ImageFilter
-from .base import FilterRegistry
+import math
+
+import numpy as np
+from PIL import Image, ImageEnhance, ImageFilter
+from .base import FilterRegistry, make_lut
+from .pointops import LutOp
+
+
+@FilterRegistry.register_point("Brightness")
+def p_brightness(brightness=1.0, **_):
+    return LutOp(make_lut(lambda v: min(255, max(0, int(v * brightness)))))
 
 
 @FilterRegistry.register("Brightness")
 def f_brightness(img, brightness=1.0, **_):
-    img = img.convert("RGB")  # на всякий случай
-    pixels = img.load()
-    w, h = img.size
+    arr = np.asarray(img.convert("RGB"))  # на всякий случай
+    return Image.fromarray(p_brightness(brightness=brightness)(arr))
 
-    for y in range(h):
-        for x in range(w):
-            r, g, b = pixels[x, y]
-            r = min(255, max(0, int(r * brightness)))
-            g = min(255, max(0, int(g * brightness)))
-            b = min(255, max(0, int(b * brightness)))
-            pixels[x, y] = (r, g, b)
 
-    return img
+@FilterRegistry.register_point("Contrast")
+def p_contrast(contrast=1.0, **_):
+    return LutOp(make_lut(lambda v: min(255, max(0, int((v - 128) * contrast + 128)))))
 
 
 @FilterRegistry.register("Contrast")
 def f_contrast(img, contrast=1.0, **_):
-    img = img.convert("RGB")
-    pixels = img.load()
-    w, h = img.size
+    arr = np.asarray(img.convert("RGB"))
+    return Image.fromarray(p_contrast(contrast=contrast)(arr))
 
-    for y in range(h):
-        for x in range(w):
-            r, g, b = pixels[x, y]
-            r = min(255, max(0, int((r - 128) * contrast + 128)))
-            g = min(255, max(0, int((g - 128) * contrast + 128)))
-            b = min(255, max(0, int((b - 128) * contrast + 128)))
-            pixels[x, y] = (r, g, b)
 
-    return img
+def blur_footprint(blur_radius=2, **_):
+    # GaussianBlur в PIL — три прохода box-blur, суммарно ~3 радиуса в каждую сторону
+    return int(math.ceil(3 * blur_radius)) + 2
 
 
-@FilterRegistry.register("Blur")
+@FilterRegistry.register("Blur", spatial=("blur_radius",), footprint=blur_footprint)
 def f_blur(img, blur_radius=2, **_):
     return img.filter(ImageFilter.GaussianBlur(radius=blur_radius))
@@ -0,0 +1,93 @@
+import numpy as np
+
+IDENTITY = np.arange(256, dtype=np.uint8)
+
+
+class LutOp:
+    """Поканальная таблица: lut формы (256,) — общая для всех каналов, или (3, 256)"""
+
+    def __init__(self, lut):
+        lut = np.asarray(lut, dtype=np.uint8)
+        self.lut = np.tile(lut, (3, 1)) if lut.ndim == 1 else lut
+
+    def __call__(self, arr):
+        return PointStage([self])(arr)
+
+
+class MatrixOp:
+    """Цветовая матрица 3x4: out_c = clip(floor(m0*r + m1*g + m2*b + m3), 0, 255).
+
+    Сумма считается в float64 слева направо, как в попиксельной версии фильтра.
+    """
+
+    def __init__(self, matrix):
+        self.matrix = np.asarray(matrix, dtype=np.float64).reshape(3, 4)
+
+    def __call__(self, arr):
+        return PointStage([self])(arr)
+
+
+def apply_lut(arr, lut):
+    if (lut == IDENTITY).all():
+        return arr
+    if (lut == lut[0]).all():
+        return lut[0][arr]
+    out = np.empty_like(arr)
+    for c in range(3):
+        out[..., c] = lut[c][arr[..., c]]
+    return out
+
+
+class PointStage:
+    """Слитые поточечные фильтры: LUT -> (не более одной) матрица 3x4 -> LUT, один проход.
+
+    Две матрицы подряд не перемножаются: между ними стоит округление,
+    и произведение дало бы другой результат.
+    """
+
+    def __init__(self, ops=()):
+        self.pre = np.tile(IDENTITY, (3, 1))
+        self.matrix = None
+        self.post = np.tile(IDENTITY, (3, 1))
+        for op in ops:
+            self.push(op)
+
+    def push(self, op):
+        """Добавляет операцию в конец; False — если её уже нельзя слить с этой стадией"""
+        if isinstance(op, LutOp):
+            if self.matrix is None:
+                self.pre = np.stack([op.lut[c][self.pre[c]] for c in range(3)])
+            else:
+                self.post = np.stack([op.lut[c][self.post[c]] for c in range(3)])
+            return True
+        if self.matrix is not None:
+            return False
+        self.matrix = op.matrix
+        return True
+
+    def describe(self):
+        if self.matrix is None:
+            return "LUT"
+        return "LUT -> 3x4 -> LUT"
+
+    def __call__(self, arr):
+        if self.matrix is None:
+            return apply_lut(arr, self.pre)
+
+        chans = [np.ascontiguousarray(arr[..., c]) for c in range(3)]
+        out = np.empty(arr.shape[:2] + (3,), dtype=np.uint8)
+        done = {}
+        for c, row in enumerate(self.matrix):
+            key = tuple(row)
+            if key not in done:
+                # вклад канала k заранее для всех 256 входов: row[k] * pre[k][v]
+                tables = [row[k] * self.pre[k].astype(np.float64) for k in range(3)]
+                s = tables[0][chans[0]]
+                s += tables[1][chans[1]]
+                s += tables[2][chans[2]]
+                if row[3]:
+                    s += row[3]
+                np.floor(s, out=s)
+                done[key] = np.clip(s, 0, 255, out=s)
+            out[..., c] = done[key]
+        return apply_lut(out, self.post)
@@ -3,6 +3,6 @@ from PIL import ImageFilter
 from .base import FilterRegistry
 
 
-@FilterRegistry.register("Emboss")
+@FilterRegistry.register("Emboss", footprint=1)  # ядро 3x3
 def f_emboss(img, **_):
     return img.filter(ImageFilter.EMBOSS)
@@ -0,0 +1,97 @@
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import numpy as np
+from PIL import Image
+
+from .base import FilterRegistry
+from .engine import plan_chain, run_plan
+
+
+def chain_halo(names, params):
+    """Сколько пикселей соседей нужно тайлу, чтобы вся цепочка посчиталась без швов"""
+    return sum(FilterRegistry.footprint(name, params) for name in names)
+
+
+def _ppm_header(f):
+    tokens = []
+    while len(tokens) < 4:
+        line = f.readline()
+        if not line:
+            raise ValueError("обрезанный заголовок PPM")
+        tokens += line.split(b"#")[0].split()
+    return tokens, f.tell()
+
+
+def open_source(path):
+    """(H, W, 3) uint8 без чтения в память для .npy и .ppm (P6); остальное PIL читает целиком"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return np.load(path, mmap_mode="r")
+    if ext == ".ppm":
+        with open(path, "rb") as f:
+            (magic, w, h, maxval), offset = _ppm_header(f)
+        if magic != b"P6" or int(maxval) != 255:
+            raise ValueError(f"{path}: поддерживается только 8-битный P6")
+        return np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=(int(h), int(w), 3))
+    with Image.open(path) as img:
+        return np.asarray(img.convert("RGB"))
+
+
+def create_target(path, h, w):
+    """Файл результата, в который тайлы пишутся по мере готовности (.npy или .ppm)"""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".npy":
+        return np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(h, w, 3))
+    if ext == ".ppm":
+        header = f"P6\n{w} {h}\n255\n".encode()
+        with open(path, "wb") as f:
+            f.write(header)
+            f.truncate(len(header) + h * w * 3)
+        return np.memmap(path, dtype=np.uint8, mode="r+", offset=len(header), shape=(h, w, 3))
+    raise ValueError("для потоковой записи нужен .npy или .ppm")
+
+
+def tiles(h, w, tile):
+    for y0 in range(0, h, tile):
+        for x0 in range(0, w, tile):
+            yield y0, x0, min(y0 + tile, h), min(x0 + tile, w)
+
+
+def process_tile(src, box, halo, plan, params):
+    y0, x0, y1, x1 = box
+    h, w = src.shape[:2]
+    hy0, hx0 = max(0, y0 - halo), max(0, x0 - halo)
+    hy1, hx1 = min(h, y1 + halo), min(w, x1 + halo)
+    # край картинки остаётся краем и у тайла — фильтры обрабатывают его так же, как на целой картинке
+    region = Image.fromarray(np.ascontiguousarray(src[hy0:hy1, hx0:hx1]))
+    out = np.asarray(run_plan(region, plan, params))
+    return out[y0 - hy0:y1 - hy0, x0 - hx0:x1 - hx0]
+
+
+def run_tiled(src, dst_path, names, params, tile=1024, workers=4):
+    """Применяет цепочку по тайлам с перекрытием; в памяти не больше ~2*workers тайлов.
+
+    src — массив (H, W, 3) uint8 (можно memmap, см. open_source).
+    """
+    h, w = src.shape[:2]
+    halo = chain_halo(names, params)
+    plan = plan_chain(names, params)
+    dst = create_target(dst_path, h, w)
+    boxes = tiles(h, w, tile)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending = {}
+        while True:
+            while len(pending) < 2 * workers:
+                box = next(boxes, None)
+                if box is None:
+                    break
+                pending[pool.submit(process_tile, src, box, halo, plan, params)] = box
+            if not pending:
+                break
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                y0, x0, y1, x1 = pending.pop(fut)
+                dst[y0:y1, x0:x1] = fut.result()
+    dst.flush()
+    return dst
@@ -1,26 +1,107 @@
+import queue
+import threading
 import tkinter as tk
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
-from filters import FilterRegistry
+from filters import ChainCache, FilterRegistry, describe_plan, plan_chain, scale_params
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 import numpy as np
 
 IMAGE_PATH = "source/img.jpg"
+CACHE_MB = 512  # бюджет кэша промежуточных результатов цепочки на полном разрешении
+PREVIEW_CACHE_MB = 64  # то же для превью
+PROXY_CACHE_SIZE = 4  # сколько уменьшенных копий (под разные размеры холста) держать
+FULL_RENDER_IDLE_MS = 1500  # полное разрешение считается, когда пользователь перестал крутить слайдеры
+POLL_MS = 50  # как часто окно забирает результат полного пересчёта
+HIST_SAMPLES = 250_000  # гистограмма считается по прореженной сетке примерно из стольких пикселей
+DEBUG_CHAIN = False  # печатать план цепочки и статистику кэша после каждого полного пересчёта
+
+
+def rgb_histogram(arr, step=1):
+    """Гистограммы R, G, B одним bincount: индексы каналов сдвинуты на 0, 256, 512.
+
+    step > 1 — берётся каждый step-й пиксель по обеим осям, счётчики домножаются на step².
+    """
+    sub = arr[::step, ::step, :3]
+    idx = sub.reshape(-1, 3).astype(np.intp) + np.array([0, 256, 512])
+    hist = np.bincount(idx.ravel(), minlength=768).reshape(3, 256)
+    return hist * (step * step)
+
+
+def image_histogram(img, samples=HIST_SAMPLES):
+    """rgb_histogram по прореженной сетке примерно из samples пикселей; None, если не RGB"""
+    arr = np.asarray(img)
+    if arr.ndim != 3 or arr.shape[2] != 3:
+        return None
+    step = max(1, int((arr.shape[0] * arr.shape[1] / samples) ** 0.5))
+    return rgb_histogram(arr, step)
 
 
 class ImageProcessor:
-    def __init__(self, img):
+    def __init__(self, img, cache_mb=CACHE_MB, preview_cache_mb=PREVIEW_CACHE_MB):
         self.original = img.convert("RGB")
         self.processed = self.original.copy()
+        self.filters, self.params = [], {}
+        self.version = 0  # растёт при каждой смене цепочки
+        self.plan = []  # полный план цепочки (для вывода)
+        self.executed = []  # шаги, реально выполненные при последнем пересчёте
+        # полное разрешение считается в потоке, превью — в цикле Tk: у каждого свой кэш,
+        # и ни один не трогается из двух потоков сразу
+        self.cache = ChainCache(cache_mb * 2 ** 20, max_sources=1)
+        self.preview_cache = ChainCache(preview_cache_mb * 2 ** 20, max_sources=PROXY_CACHE_SIZE)
+        self._proxies = OrderedDict()
+        self._full_version = 0  # версия цепочки, по которой посчитан processed
+        self._full_lock = threading.Lock()
+
+    def set_chain(self, filters, params):
+        """Запоминает цепочку; полное разрешение пересчитается в render_full()"""
+        self.filters, self.params = list(filters), dict(params)
+        self.version += 1
+
+    def snapshot(self):
+        """(версия, фильтры, параметры) — неизменяемый снимок цепочки для потока"""
+        return self.version, self.filters, self.params
 
     def apply(self, filters, params):
-        img = self.original.copy()
-        for name in filters:
-            func = FilterRegistry.get_filters().get(name)
-            if func:
-                img = func(img, **params)
-        self.processed = img
+        self.set_chain(filters, params)
+        return self.render_full()
+
+    def render_full(self, chain=None):
+        """Цепочка на полном разрешении; chain — снимок snapshot(), если вызов из потока.
+
+        Снимок старше уже посчитанного не пересчитывается: возвращается свежий результат.
+        """
+        version, filters, params = chain or self.snapshot()
+        with self._full_lock:
+            if version > self._full_version:
+                self.processed, self.executed = self.cache.run(self.original, filters, params)
+                self.plan = plan_chain(filters, params)
+                self._full_version = version
+            return self.processed
+
+    def proxy(self, w, h):
+        """Исходник, уменьшенный под холст w×h (не увеличивается); кэшируется по размеру"""
+        iw, ih = self.original.size
+        s = min(w / iw, h / ih, 1.0)
+        size = (max(1, int(iw * s)), max(1, int(ih * s)))
+        img = self._proxies.get(size)
+        if img is None:
+            img = self.original if size == self.original.size else self.original.resize(size)
+            self._proxies[size] = img
+            while len(self._proxies) > PROXY_CACHE_SIZE:
+                self._proxies.popitem(last=False)
+        else:
+            self._proxies.move_to_end(size)
+        return img
+
+    def preview(self, w, h):
+        """Текущая цепочка на уменьшенной копии; радиусы масштабируются вместе с картинкой"""
+        proxy = self.proxy(w, h)
+        params = scale_params(self.params, proxy.width / self.original.width)
+        img, _ = self.preview_cache.run(proxy, self.filters, params, source=proxy.size)
         return img
 
 
@@ -106,9 +187,18 @@ class ImageEditorApp:
         self.canvas_hist.get_tk_widget().pack(fill="both", expand=True)
 
         self._left_img = self._right_img = None
+        self._full_after_id = None
+        # полное разрешение считается в отдельном потоке, результат забирается опросом очереди
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.results = queue.Queue()
+        self._pending = 0  # отправлено в поток и ещё не забрано из очереди
+        self._poll_id = None
+        self._hist_bars = None
+        self._hist_version = None
 
     # === События ===
     def _bind_events(self):
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
         self.root.bind("<Configure>", lambda e: self.root.after(300, self.update_preview))
         self.listbox.bind("<Double-Button-1>", lambda e: self.apply_filters())
 
@@ -121,12 +211,57 @@ class ImageEditorApp:
             posterize_bits=int(round(self.posterize_scale.get())),
         )
         selected = [self.listbox.get(i) for i in self.listbox.curselection()]
-        self.processor.apply(selected, params)
+        self.processor.set_chain(selected, params)
         self.update_preview()
+        self.schedule_full_render()
+
+    # === Полное разрешение — в простое ===
+    def schedule_full_render(self):
+        if self._full_after_id is not None:
+            self.root.after_cancel(self._full_after_id)
+        self._full_after_id = self.root.after(FULL_RENDER_IDLE_MS, self.render_full)
+
+    def render_full(self):
+        self._full_after_id = None
+        self.executor.submit(self.full_job, self.processor.snapshot())
+        self._pending += 1
+        if self._poll_id is None:
+            self._poll_id = self.root.after(POLL_MS, self.poll_results)
+
+    def full_job(self, chain):
+        """Выполняется в потоке; Tk отсюда не трогаем — только очередь"""
+        try:
+            hist = image_histogram(self.processor.render_full(chain))
+        except Exception as e:
+            self.results.put(("error", chain[0], e))
+        else:
+            self.results.put(("done", chain[0], hist))
+
+    def poll_results(self):
+        """Забирает результаты полного пересчёта в цикле Tk; устаревшие версии цепочки пропускаются"""
+        self._poll_id = None
+        while True:
+            try:
+                kind, version, payload = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self._pending -= 1
+            if version != self.processor.version:
+                continue
+            if kind == "error":
+                messagebox.showerror("Ошибка", str(payload))
+                continue
+            # гистограмма превью заменяется гистограммой полного разрешения
+            self.draw_histogram(payload)
+            if DEBUG_CHAIN:
+                print(describe_plan(self.processor.plan, self.processor.executed))
+                print("Кэш цепочки:", self.processor.cache.stats())
+        if self._pending:
+            self._poll_id = self.root.after(POLL_MS, self.poll_results)
 
     # === Сброс ===
     def reset(self):
-        self.processor.processed = self.processor.original.copy()
+        self.processor.apply([], {})
         self.listbox.selection_clear(0, "end")
         self.blur_scale.set(2)
         self.contrast_scale.set(1)
@@ -137,7 +272,7 @@ class ImageEditorApp:
     # === Сохранение ===
     def save(self):
         try:
-            self.processor.processed.save("result.png")
+            self.processor.render_full().save("result.png")
             messagebox.showinfo("Сохранено", "✅ result.png сохранён")
         except Exception as e:
             messagebox.showerror("Ошибка", str(e))
@@ -155,8 +290,9 @@ class ImageEditorApp:
             self.root.after(200, self.update_preview)
             return
 
-        left = fit(self.processor.original, lw, lh)
-        right = fit(self.processor.processed, rw, rh)
+        preview = self.processor.preview(rw, rh)
+        left = fit(self.processor.proxy(lw, lh), lw, lh)
+        right = fit(preview, rw, rh)
         self._left_img = ImageTk.PhotoImage(left)
         self._right_img = ImageTk.PhotoImage(right)
 
@@ -165,43 +301,55 @@ class ImageEditorApp:
         self.left.create_image(lw // 2, lh // 2, image=self._left_img, anchor="center")
         self.right.create_image(rw // 2, rh // 2, image=self._right_img, anchor="center")
 
-        self.update_histogram(self.processor.processed)
+        # ресайз окна не меняет картинку — гистограмму не пересчитываем
+        if self._hist_version != self.processor.version:
+            self._hist_version = self.processor.version
+            self.update_histogram(preview)
 
     # === Гистограмма RGB (столбчатая) ===
     def update_histogram(self, img):
         """Обновляет большую RGB-гистограмму в виде бар-графика"""
-        self.ax.clear()
-        arr = np.array(img)
-        if arr.ndim == 3 and arr.shape[2] == 3:
-            colors = ("red", "green", "blue")
-            labels = ("Red", "Green", "Blue")
-            bins = np.arange(257)
-
-            # Рисуем три столбчатых гистограммы с прозрачностью
-            for i, (col, label) in enumerate(zip(colors, labels)):
-                hist, _ = np.histogram(arr[..., i], bins=bins)
-                self.ax.bar(
-                    bins[:-1],
-                    hist,
-                    color=col,
-                    alpha=0.5,
-                    width=1.0,
-                    label=label,
-                )
-
-            self.ax.set_xlim(0, 256)
-            self.ax.set_xlabel("Яркость (0–255)", fontsize=9)
-            self.ax.set_ylabel("Количество пикселей", fontsize=9)
-            self.ax.legend(loc="upper right", fontsize=8)
-            self.ax.set_title("Столбчатая гистограмма каналов RGB", fontsize=11, fontweight="bold")
-            self.ax.grid(alpha=0.3)
-            self.figure.tight_layout()
-            self.canvas_hist.draw()
+        self.draw_histogram(image_histogram(img))
+
+    def draw_histogram(self, hist):
+        if hist is None:
+            return
+        if self._hist_bars is None:
+            self._build_histogram()
+        # Столбцы строятся один раз, дальше меняется только их высота
+        for bars, counts in zip(self._hist_bars, hist):
+            for rect, h in zip(bars, counts):
+                rect.set_height(h)
+        self.ax.set_ylim(0, max(1, hist.max()) * 1.05)
+        self.canvas_hist.draw_idle()
+
+    def _build_histogram(self):
+        colors = ("red", "green", "blue")
+        labels = ("Red", "Green", "Blue")
+        bins = np.arange(256)
+
+        # Три столбчатых гистограммы с прозрачностью
+        self._hist_bars = [
+            self.ax.bar(bins, np.zeros(256), color=col, alpha=0.5, width=1.0, label=label)
+            for col, label in zip(colors, labels)
+        ]
+        self.ax.set_xlim(0, 256)
+        self.ax.set_xlabel("Яркость (0–255)", fontsize=9)
+        self.ax.set_ylabel("Количество пикселей", fontsize=9)
+        self.ax.legend(loc="upper right", fontsize=8)
+        self.ax.set_title("Столбчатая гистограмма каналов RGB", fontsize=11, fontweight="bold")
+        self.ax.grid(alpha=0.3)
+        self.figure.tight_layout()
 
     # === Запуск ===
     def run(self):
         self.root.mainloop()
 
+    def close(self):
+        # ещё не начатые пересчёты отменяются; начатый дорабатывает в фоне, окно не ждёт
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.root.destroy()
+
 
 if __name__ == "__main__":
     app = ImageEditorApp(IMAGE_PATH)
@@ -0,0 +1,106 @@
+"""Время одного обновления тепловой карты: прежний расчёт через meshgrid и
+RGBA-раскраску против расчёта из одномерных таблиц в переиспользуемых буферах.
+Для каждого варианта — среднее время и пиковый объём выделенной памяти за обновление,
+в конце — сколько пикселей буферов расходятся с прежним heatmap (маска и значения).
+
+Запуск: python bench.py
+"""
+import time
+import tracemalloc
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+from illuminance import HeatmapBuffers, SCENE_SIZE, disk_stats, heatmap, pixel_axes
+
+PARAMS = {'xL': 624.0, 'yL': 0.0, 'zL': 1000.0, 'I0': 1000.0, 'R': 800.0}
+SIZES = (100, 600, 1200)
+REPEATS = 10
+
+
+def calculate_meshgrid(p, Wres, Hres):
+    """Исходный расчёт из LightingLabPerfect.calculate: полная сетка и RGBA-копия"""
+    x = np.linspace(-SCENE_SIZE / 2, SCENE_SIZE / 2, Wres)
+    y = np.linspace(-SCENE_SIZE / 2, SCENE_SIZE / 2, Hres)
+    X, Y = np.meshgrid(x, y)
+
+    dx = X - p['xL']
+    dy = Y - p['yL']
+    dz = p['zL']
+    r = np.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
+    cos_theta = dz / r
+    E = p['I0'] * (cos_theta ** 2) / (r / 1000.0) ** 2
+
+    mask = X ** 2 + Y ** 2 <= p['R'] ** 2
+    E_phys = np.zeros_like(E)
+    E_phys[mask] = E[mask]
+    E_norm = np.zeros_like(E)
+    E_norm[mask] = E[mask] / np.max(E[mask])
+    E_img = plt.cm.hot(E_norm)[:, :, :3]
+    return E_img, np.max(E_phys), np.min(E_phys[mask]), np.mean(E_phys[mask])
+
+
+def one_shot(p, Wres, Hres):
+    x, y = pixel_axes(Wres, Hres)
+    return heatmap(p, x, y), disk_stats(p)
+
+
+def make_reused():
+    buffers = HeatmapBuffers()
+
+    def reused(p, Wres, Hres):
+        x, y = pixel_axes(Wres, Hres)
+        return buffers.evaluate(p, x, y), disk_stats(p)
+    return reused
+
+
+def heatmap_outer(p, xs, ys, dtype=np.float32):
+    """heatmap до переиспользуемых буферов: новые матрицы, маска через np.add.outer"""
+    z2 = p['zL'] ** 2
+    dx2 = np.square(xs - p['xL']).astype(dtype)
+    dy2 = (np.square(ys - p['yL']) + z2).astype(dtype)
+    out = np.add.outer(dy2, dx2)  # r²
+    np.square(out, out=out)
+    np.divide(dtype(p['I0'] * 1e6 * z2), out, out=out)
+    out[np.add.outer(np.square(ys), np.square(xs)) > p['R'] ** 2] = 0
+    return out
+
+
+def measure(fn, n):
+    """Среднее время (мс) и пик выделенной памяти (МБ) на одно обновление"""
+    fn(PARAMS, n, n)  # прогрев: буферы, кэши numpy
+    t0 = time.perf_counter()
+    for k in range(REPEATS):
+        fn(dict(PARAMS, xL=PARAMS['xL'] + k), n, n)
+    elapsed = (time.perf_counter() - t0) / REPEATS
+
+    tracemalloc.start()
+    fn(dict(PARAMS, xL=-PARAMS['xL']), n, n)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 2 ** 20
+
+
+def main():
+    variants = [("meshgrid + RGBA", calculate_meshgrid), ("новые буферы", one_shot),
+                ("переиспользование", make_reused())]
+    print(f"{'сетка':>10} {'вариант':>20} {'мс/обновление':>14} {'выделено, МБ':>13}")
+    for n in SIZES:
+        for name, fn in variants:
+            ms, mb = measure(fn, n)
+            print(f"{n:>5}x{n:<4} {name:>20} {ms:>14.2f} {mb:>13.2f}")
+
+    buffers = HeatmapBuffers()
+    for n in SIZES:
+        x, y = pixel_axes(n, n)
+        mask = value = 0
+        for R in np.linspace(50, 1500, 59):
+            p = dict(PARAMS, R=R)
+            new, old = buffers.evaluate(p, x, y), heatmap_outer(p, x, y)
+            mask += int(((new == 0) != (old == 0)).sum())
+            value += int((new != old).sum())
+        print(f"{n:>5}x{n:<4} расхождений с прежним heatmap по 59 радиусам: маска {mask}, значения {value}")
+
+
+if __name__ == "__main__":
+    main()
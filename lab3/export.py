@@ -0,0 +1,121 @@
+"""Выгрузка поля освещённости E (лк) для анализа вне GUI.
+
+На диск пишутся:
+    <имя>.npy      — E формы (H, W), строки по y снизу вверх, вне круга 0;
+    <имя>_x.npy    — координаты центров столбцов, мм (W,);
+    <имя>_y.npy    — координаты центров строк, мм (H,);
+    <имя>.json     — параметры, размер сцены, тип данных и статистика по кругу.
+
+Поле пишется полосами строк прямо в memmap-файл, поэтому даже сетка 20000×20000
+не держится в памяти целиком: на полосу нужно block_rows × W значений.
+Открыть результат без чтения в память — load_field (np.load с mmap_mode='r').
+
+Пример:
+    python export.py out/field --W 20000 --H 20000 --xL 300 --sources "disk[0,0,800,500,200]"
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+
+from illuminance import SCENE_SIZE, HeatmapBuffers, disk_stats, expand_sources, parse_sources, pixel_axes
+
+BLOCK_ROWS = 256
+DEFAULT_PARAMS = {'xL': 624.0, 'yL': 0.0, 'zL': 1000.0, 'I0': 1000.0, 'R': 800.0}
+
+
+def field_paths(base):
+    return {
+        'E': base + ".npy",
+        'x': base + "_x.npy",
+        'y': base + "_y.npy",
+        'meta': base + ".json",
+    }
+
+
+def export_field(base, p, Wres, Hres, dtype=np.float32, block_rows=BLOCK_ROWS, workers=1, progress=None):
+    """Считает E на сетке Wres × Hres полосами по block_rows строк и пишет в <base>.npy.
+
+    p — параметры как в illuminance (xL, yL, zL, I0, R и, при необходимости, sources).
+    progress(готово_строк, всего_строк) вызывается после каждой полосы.
+    Возвращает словарь путей к файлам.
+    """
+    paths = field_paths(base)
+    os.makedirs(os.path.dirname(os.path.abspath(base)), exist_ok=True)
+    x, y = pixel_axes(Wres, Hres)
+    np.save(paths['x'], x)
+    np.save(paths['y'], y)
+
+    t0 = time.perf_counter()
+    # сначала во временный файл: оборванная выгрузка не оставит битый .npy под нужным именем
+    tmp = paths['E'] + ".tmp"
+    out = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=(Hres, Wres))
+    buffers = HeatmapBuffers(dtype)
+    for r0 in range(0, Hres, block_rows):
+        r1 = min(r0 + block_rows, Hres)
+        out[r0:r1] = buffers.evaluate(p, x, y[r0:r1], workers)
+        if progress:
+            progress(r1, Hres)
+    out.flush()
+    del out
+    os.replace(tmp, paths['E'])
+    elapsed = time.perf_counter() - t0
+
+    sources = p.get('sources')
+    meta = {
+        'params': {k: float(p[k]) for k in ('xL', 'yL', 'zL', 'I0', 'R')},
+        # дополнительные источники уже разложены в точечные: x, y, z, I0
+        'sources': [] if sources is None else np.asarray(sources, dtype=float).tolist(),
+        'W': Wres,
+        'H': Hres,
+        'scene_size_mm': SCENE_SIZE,
+        'dtype': np.dtype(dtype).name,
+        'units': {'E': 'лк', 'x': 'мм', 'y': 'мм'},
+        'layout': 'E[i, j] = E(x[j], y[i]), вне круга радиуса R — 0',
+        'files': {k: os.path.basename(v) for k, v in paths.items() if k != 'meta'},
+        'stats': {k: float(v) for k, v in disk_stats(p).items()},
+        'seconds': elapsed,
+    }
+    with open(paths['meta'], "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    return paths
+
+
+def load_field(base):
+    """(E, x, y, meta); E открыт как memmap только для чтения"""
+    paths = field_paths(base)
+    with open(paths['meta'], encoding="utf-8") as f:
+        meta = json.load(f)
+    return np.load(paths['E'], mmap_mode='r'), np.load(paths['x']), np.load(paths['y']), meta
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Выгрузка поля освещённости ЛР3 в .npy + .json")
+    parser.add_argument("base", help="путь без расширения: <base>.npy, <base>_x.npy, <base>_y.npy, <base>.json")
+    parser.add_argument("--W", type=int, default=600)
+    parser.add_argument("--H", type=int, default=600)
+    for key, value in DEFAULT_PARAMS.items():
+        parser.add_argument(f"--{key}", type=float, default=value)
+    parser.add_argument("--sources", default="", help="доп. источники: [x,y,z,I0]; rect[x,y,z,I0,a,b]; disk[x,y,z,I0,r]")
+    parser.add_argument("--float64", action="store_true", help="писать float64 вместо float32")
+    parser.add_argument("--block", type=int, default=BLOCK_ROWS, help="строк в полосе")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="потоков на полосу")
+    args = parser.parse_args(argv)
+
+    p = {key: getattr(args, key) for key in DEFAULT_PARAMS}
+    p['sources'] = expand_sources(parse_sources(args.sources))
+
+    def progress(done, total):
+        print(f"\r  строк {done}/{total}", end="", flush=True)
+
+    t0 = time.perf_counter()
+    paths = export_field(args.base, p, args.W, args.H, np.float64 if args.float64 else np.float32,
+                         args.block, args.workers, progress)
+    elapsed = time.perf_counter() - t0
+    print(f"\nЗаписано {args.W}×{args.H} за {elapsed:.2f} с: {paths['E']}")
+
+
+if __name__ == "__main__":
+    main()
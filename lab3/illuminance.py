@@ -0,0 +1,502 @@
+"""Освещённость круга от точечных и протяжённых источников без GUI.
+
+E(x, y) = I0 · cos²θ / (r / 1000)², r — расстояние от источника (x, y, z) до точки
+плоскости, cos θ = z / r. Поле показывается на квадрате SCENE_SIZE × SCENE_SIZE мм,
+учитывается только круг радиуса R с центром в начале координат (и его часть внутри квадрата).
+
+Основной источник задаётся ключами xL, yL, zL, I0 словаря параметров, дополнительные —
+массивом p['sources'] формы (N, 4): x, y, z, I0 (см. parse_sources и expand_sources:
+прямоугольные и круглые излучатели раскладываются в узлы квадратуры Гаусса).
+
+Статистика по кругу считается без сетки пикселей и от W×H не зависит: среднее и значения
+в центре/на краях — точно (замкнутая форма или адаптивная квадратура); min/max для одного
+источника — аналитически, для нескольких — многостартовым поиском по непрерывной области.
+Поиск эвристический: экстремум уточняется до EXTREMA_TOL мм, но пик уже шага стартовой
+сетки (2·min(R, SCENE_SIZE / 2) / (EXTREMA_GRID − 1)) может быть пропущен, поэтому найденный max — оценка снизу,
+min — сверху. Протяжённые излучатели везде заменены узлами квадратуры (AREA_NODES² точек),
+и «точная» статистика точна для этой дискретизации, а не для излучателя как такового.
+"""
+import math
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from numpy.polynomial.legendre import leggauss
+
+SCENE_SIZE = 2000.0  # сторона сцены, мм (не зависит от разрешения)
+
+QUAD_TOL = 1e-10  # относительная точность адаптивной квадратуры среднего
+_GAUSS = leggauss(16), leggauss(32)
+
+AREA_NODES = 6  # порядок квадратуры протяжённого излучателя по каждой оси
+CHUNK = 1 << 20  # элементов (источники × пиксели) за один проход тепловой карты
+
+EXTREMA_GRID = 48  # стартовая сетка поиска min/max по области
+EXTREMA_BOUNDARY = 720  # стартовые точки на границе области
+EXTREMA_STARTS = 8  # сколько лучших стартов уточнять
+EXTREMA_TOL = 1e-4  # мм: шаг, на котором уточнение останавливается
+
+
+def pixel_axes(Wres, Hres, size=SCENE_SIZE):
+    """Координаты центров пикселей, мм: x (Wres,), y (Hres,)"""
+    return np.linspace(-size / 2, size / 2, Wres), np.linspace(-size / 2, size / 2, Hres)
+
+
+# ==================== ИСТОЧНИКИ ====================
+
+def parse_sources(text):
+    """Разбор строки вида "[x,y,z,I0]; rect[x,y,z,I0,a,b]; disk[x,y,z,I0,r]".
+
+    rect — прямоугольник a × b мм с центром (x, y) на высоте z, disk — круг радиуса r;
+    I0 протяжённого излучателя — суммарная сила света, делится между узлами квадратуры.
+    """
+    sources = []
+    for part in text.replace(" ", "").split(';'):
+        m = re.fullmatch(r'(rect|disk)?\[([^\]]*)\]', part)
+        if not m:
+            continue
+        kind = m.group(1) or "point"
+        nums = [float(v) for v in re.findall(r'-?\d+\.?\d*(?:[eE]-?\d+)?', m.group(2))]
+        if len(nums) == {"point": 4, "rect": 6, "disk": 5}[kind]:
+            sources.append((kind, nums))
+    return sources
+
+
+def expand_sources(sources, nodes=AREA_NODES):
+    """Источники из parse_sources -> точечные (N, 4): x, y, z, I0"""
+    g, w = leggauss(nodes)
+    out = []
+    for kind, nums in sources:
+        if kind == "point":
+            out.append(np.array([nums]))
+            continue
+        x, y, z, I0 = nums[:4]
+        if kind == "rect":
+            a, b = nums[4:]
+            u, v = np.meshgrid(g * a / 2, g * b / 2)
+            weights = np.outer(w, w).ravel() / 4
+            xy = np.stack([x + u.ravel(), y + v.ravel()], axis=1)
+        else:
+            # равные площади: Гаусс по r², по углу — равномерно (точно для периодических функций)
+            r0 = nums[4]
+            rad = r0 * np.sqrt((g + 1) / 2)
+            phi = np.arange(2 * nodes) * math.pi / nodes
+            rr, pp = np.meshgrid(rad, phi)
+            weights = np.tile(w / 2, 2 * nodes) / (2 * nodes)
+            xy = np.stack([x + (rr * np.cos(pp)).ravel(), y + (rr * np.sin(pp)).ravel()], axis=1)
+        out.append(np.column_stack([xy, np.full(len(xy), z), I0 * weights]))
+    return np.vstack(out) if out else np.empty((0, 4))
+
+
+def point_sources(p):
+    """Все источники параметров p как точечные (N, 4); первый — основной (xL, yL, zL, I0)"""
+    main = np.array([[p['xL'], p['yL'], p['zL'], p['I0']]], dtype=float)
+    extra = p.get('sources')
+    if extra is None or not len(extra):
+        return main
+    return np.vstack([main, extra])
+
+
+def E_at(x_mm, y_mm, p):
+    S = point_sources(p)
+    dx = x_mm - S[:, 0]
+    dy = y_mm - S[:, 1]
+    dz = S[:, 2]
+    r_mm = (dx * dx + dy * dy + dz * dz) ** 0.5
+    cos_theta = dz / r_mm
+    E = S[:, 3] * (cos_theta ** 2) / ((r_mm / 1000.0) ** 2)
+    return float(E.sum())
+
+
+def E_foot(d2, p):
+    """E на горизонтальном расстоянии sqrt(d2) от проекции источника: I0·1e6·z² / (d² + z²)²"""
+    z2 = p['zL'] ** 2
+    return p['I0'] * 1e6 * z2 / (d2 + z2) ** 2
+
+
+def field(S, x, y):
+    """Сумма E от источников S в точках (x, y) любой формы; источники идут порциями"""
+    x, y = np.broadcast_arrays(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+    xf, yf = x.ravel(), y.ravel()
+    E = np.zeros(len(xf))
+    step = max(1, CHUNK // max(len(xf), 1))
+    for s0 in range(0, len(S), step):
+        s = S[s0:s0 + step, :, None]
+        z2 = s[:, 2] ** 2
+        d2 = np.square(xf - s[:, 0]) + np.square(yf - s[:, 1])
+        E += (s[:, 3] * 1e6 * z2 / (d2 + z2) ** 2).sum(axis=0)
+    return E.reshape(x.shape)
+
+
+# ==================== СТАТИСТИКА ====================
+
+def _in_region(x, y, R, half):
+    return x * x + y * y <= R * R * (1 + 1e-12) and abs(x) <= half and abs(y) <= half
+
+
+def _in_region_v(x, y, R, half):
+    return (x * x + y * y <= R * R * (1 + 1e-12)) & (np.abs(x) <= half) & (np.abs(y) <= half)
+
+
+def _region_candidates(p, R, half):
+    """Точки области (круг ∩ квадрат), среди которых лежат ближайшая и самая дальняя
+    к проекции источника: проекции на дугу и на отрезки сторон, углы и концы дуг.
+
+    E монотонно убывает с расстоянием до проекции источника, поэтому max и min E
+    по выпуклой области достигаются в этих точках.
+    """
+    xL, yL = p['xL'], p['yL']
+    a = math.hypot(xL, yL)
+    ux, uy = (xL / a, yL / a) if a > 0 else (1.0, 0.0)
+    pts = [(R * ux, R * uy), (-R * ux, -R * uy)]
+    if R > half:
+        # стороны квадрата внутри круга: x = ±half, |y| <= m (и симметрично)
+        m = min(half, math.sqrt(R * R - half * half))
+        for s in (-half, half):
+            pts += [(s, min(max(yL, -m), m)), (min(max(xL, -m), m), s)]
+            pts += [(s, -m), (s, m), (-m, s), (m, s)]
+    return [(x, y) for x, y in pts if _in_region(x, y, R, half)]
+
+
+def _radial_integral(rho, c, s, S):
+    """∫_0^rho ΣE(t·c, t·s) · t dt в замкнутом виде (луч из центра круга под углом φ).
+
+    rho, c, s — по узлам φ; источники S — по первой оси, по ним сумма.
+    """
+    x, y = S[:, 0, None], S[:, 1, None]
+    z2 = S[:, 2, None] ** 2
+    q = x ** 2 + y ** 2 + z2
+    b = x * c + y * s
+    D = q - b * b  # > 0: не меньше z²
+    sqD = np.sqrt(D)
+
+    def F(t):  # первообразная (u + b) / (u² + D)² по u = t - b
+        u = t - b
+        return -0.5 / (u * u + D) + b * (u / (2 * D * (u * u + D)) + np.arctan(u / sqD) / (2 * D * sqD))
+
+    return (S[:, 3, None] * 1e6 * z2 * (F(rho) - F(0.0))).sum(axis=0)
+
+
+def _boundary_radius(phi, R, half):
+    return np.minimum(R, half / np.maximum(np.abs(np.cos(phi)), np.abs(np.sin(phi))))
+
+
+def _boundary_kinks(R, half):
+    """Углы изломов границы круга ∩ квадрата: диагонали и пересечения окружности со сторонами"""
+    kinks = [k * math.pi / 4 for k in range(9)]
+    if half < R < half * math.sqrt(2):
+        alpha = math.acos(half / R)
+        kinks += [k * math.pi / 2 + sgn * alpha for k in range(5) for sgn in (-1, 1)]
+    return sorted(k for k in kinks if 0 <= k <= 2 * math.pi)
+
+
+def _clipped_integral(S, R, half, tol=QUAD_TOL):
+    """∫ ΣE dA по кругу ∩ квадрату: φ — адаптивный Гаусс, радиус — в замкнутом виде.
+
+    Граница области r = ρ(φ) гладкая между изломами (диагонали квадрата и точки, где
+    окружность пересекает стороны), поэтому интервалы изначально режутся по изломам.
+    """
+    def piece(lo, hi, rule):
+        x, w = rule
+        phi = 0.5 * (hi - lo) * x + 0.5 * (hi + lo)
+        c, s = np.cos(phi), np.sin(phi)
+        return 0.5 * (hi - lo) * np.dot(w, _radial_integral(_boundary_radius(phi, R, half), c, s, S))
+
+    kinks = _boundary_kinks(R, half)
+    stack = list(zip(kinks[:-1], kinks[1:]))
+
+    total = 0.0
+    while stack:
+        lo, hi = stack.pop()
+        if hi - lo < 1e-12:
+            continue
+        coarse, fine = piece(lo, hi, _GAUSS[0]), piece(lo, hi, _GAUSS[1])
+        if abs(fine - coarse) <= tol * abs(fine) or hi - lo < 1e-9:
+            total += fine
+        else:
+            mid = 0.5 * (lo + hi)
+            stack += [(lo, mid), (mid, hi)]
+    return total
+
+
+def _clipped_area(R, half):
+    """Площадь круга радиуса R ∩ квадрата со стороной 2·half, центры совпадают"""
+    if R <= half:
+        return math.pi * R * R
+    if R >= half * math.sqrt(2):
+        return 4 * half * half
+    m = math.sqrt(R * R - half * half)
+    alpha = math.acos(half / R)
+    # круг минус четыре сегмента за сторонами квадрата
+    return math.pi * R * R - 4 * (R * R * alpha - half * m)
+
+
+def disk_mean(p, R, half=SCENE_SIZE / 2):
+    """Среднее E по кругу радиуса R (в пределах сцены) — сумма по всем источникам"""
+    S = point_sources(p)
+    if R <= half:
+        # ∫∫ z² / (d² + z²)² dA по кругу = π/2 · (1 + (R² - a² - z²) / sqrt((R² + a² + z²)² - 4a²R²))
+        a2 = S[:, 0] ** 2 + S[:, 1] ** 2
+        z2 = S[:, 2] ** 2
+        s = R * R + a2 + z2
+        ratio = (R * R - a2 - z2) / np.sqrt(s * s - 4 * a2 * R * R)
+        return float((S[:, 3] * 1e6 * (1 + ratio) / (2 * R * R)).sum())
+    return _clipped_integral(S, R, half) / _clipped_area(R, half)
+
+
+def _refine(S, pts, sign, R, half):
+    """Локальный поиск экстремума sign·ΣE из стартовых точек внутри области.
+
+    Шаг по восьми направлениям; точка сдвигается, пока это улучшает значение и
+    не выводит из области, иначе шаг делится пополам — до EXTREMA_TOL мм.
+    """
+    dirs = np.array([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)], dtype=float)
+    dirs[4:] /= math.sqrt(2)
+    pts = pts.copy()
+    val = sign * field(S, pts[:, 0], pts[:, 1])
+    step = np.full(len(pts), 2 * min(R, half) / EXTREMA_GRID)
+    while (step > EXTREMA_TOL).any():
+        trial = pts[:, None, :] + step[:, None, None] * dirs[None]
+        v = sign * field(S, trial[..., 0], trial[..., 1])
+        v[~_in_region_v(trial[..., 0], trial[..., 1], R, half)] = -np.inf
+        best = v.argmax(axis=1)
+        gain = v[np.arange(len(pts)), best] > val
+        pts[gain] = trial[gain, best[gain]]
+        val[gain] = v[gain, best[gain]]
+        step[~gain] /= 2
+    return val.max()
+
+
+def _refine_boundary(S, phis, sign, R, half):
+    """То же на границе области r = ρ(φ): золотое сечение по φ около каждого старта"""
+    width = 2 * math.pi / EXTREMA_BOUNDARY
+    lo, hi = phis - width, phis + width
+
+    def f(phi):
+        rho = _boundary_radius(phi, R, half)
+        return sign * field(S, rho * np.cos(phi), rho * np.sin(phi))
+
+    g = (math.sqrt(5) - 1) / 2
+    a, b = hi - g * (hi - lo), lo + g * (hi - lo)
+    fa, fb = f(a), f(b)
+    while ((hi - lo) * R > EXTREMA_TOL).any():
+        # максимум слева от b: отбрасываем (b, hi], иначе [lo, a)
+        left = fa > fb
+        lo, hi = np.where(left, lo, a), np.where(left, b, hi)
+        a, b = np.where(left, hi - g * (hi - lo), b), np.where(left, a, lo + g * (hi - lo))
+        fa, fb = np.where(left, f(a), fb), np.where(left, fa, f(b))
+    return max(f(lo).max(), f(hi).max(), f(0.5 * (lo + hi)).max())
+
+
+def _field_extrema(S, R, half):
+    """(max, min) суммарного поля по кругу ∩ квадрату — многостартовый поиск.
+
+    Старты: сетка EXTREMA_GRID² по области, проекции источников внутри неё
+    и EXTREMA_BOUNDARY точек границы; лучшие уточняются внутри и вдоль границы.
+    """
+    m = min(R, half)
+    g = np.linspace(-m, m, EXTREMA_GRID)
+    gx, gy = [a.ravel() for a in np.meshgrid(g, g)]
+    gx, gy = np.r_[gx, S[:, 0]], np.r_[gy, S[:, 1]]
+    inside = _in_region_v(gx, gy, R, half)
+    pts = np.stack([gx[inside], gy[inside]], axis=1)
+
+    kinks = np.array(_boundary_kinks(R, half))
+    phis = np.r_[np.linspace(0, 2 * math.pi, EXTREMA_BOUNDARY, endpoint=False), kinks]
+    rho = _boundary_radius(phis, R, half)
+    bx, by = rho * np.cos(phis), rho * np.sin(phis)
+
+    E_in = field(S, pts[:, 0], pts[:, 1])
+    E_b = field(S, bx, by)
+    out = []
+    for sign in (1, -1):
+        k_in = np.argsort(-sign * E_in)[:EXTREMA_STARTS]
+        k_b = np.argsort(-sign * E_b)[:EXTREMA_STARTS]
+        best = max(_refine(S, pts[k_in], sign, R, half),
+                   _refine_boundary(S, phis[k_b], sign, R, half),
+                   (sign * E_b).max(), (sign * E_in).max())
+        out.append(sign * best)
+    return out[0], out[1]
+
+
+def disk_stats(p, half=SCENE_SIZE / 2):
+    """E в центре и на краях круга, min/max/среднее по кругу — без сетки пикселей.
+
+    С одним источником все значения точные. С дополнительными min/max дают _field_extrema —
+    эвристика без гарантии (см. описание модуля), проверить их можно по extrema_exact(p).
+    """
+    R = p['R']
+    if not extrema_exact(p):
+        E_max, E_min = _field_extrema(point_sources(p), R, half)
+    else:
+        xL, yL = p['xL'], p['yL']
+        d2 = [(x - xL) ** 2 + (y - yL) ** 2 for x, y in _region_candidates(p, R, half)]
+        near = 0.0 if _in_region(xL, yL, R, half) else min(d2)
+        E_max, E_min = E_foot(near, p), E_foot(max(d2), p)
+    return {
+        'center': E_at(0.0, 0.0, p),
+        'edge_x': E_at(R, 0.0, p),
+        'edge_y': E_at(0.0, R, p),
+        'max': E_max,
+        'min': E_min,
+        'mean': disk_mean(p, R, half),
+    }
+
+
+def extrema_exact(p):
+    """True, если min/max из disk_stats найдены аналитически (один источник)"""
+    return p.get('sources') is None or not len(p['sources'])
+
+
+# ==================== СЕТКА ====================
+
+class HeatmapBuffers:
+    """Буферы тепловой карты, переиспользуемые между обновлениями.
+
+    E(x, y) зависит только от dx² + dy², поэтому r² собирается из двух одномерных
+    таблиц, а маска круга — из таблиц x² и y². Матрицы (H, W) выделяются
+    заново только при смене размера сетки; evaluate возвращает один и тот же буфер.
+
+    Несколько источников считаются пачками (источники × строки × W) не больше CHUNK
+    элементов; при workers > 1 полосы строк раздаются потокам (numpy отпускает GIL).
+    """
+
+    def __init__(self, dtype=np.float32):
+        self.dtype = dtype
+        self.xs = self.ys = None
+        self._pool = None
+        self._workers = 0
+        self._mask_R = None  # R, для которого посчитана маска outside
+        self._scratch = {}
+
+    def _resize(self, xs, ys):
+        H, W = len(ys), len(xs)
+        if self.xs is None or self.E.shape != (H, W):
+            self.E = np.empty((H, W), dtype=self.dtype)
+            self.outside = np.empty((H, W), dtype=bool)
+            self.r2 = np.empty((H, W))  # x² + y² в float64 — для маски круга
+            # одномерные таблицы считаются в float64 и один раз приводятся к dtype
+            self.dx, self.dy = np.empty(W), np.empty(H)
+            self.dx2 = np.empty(W, dtype=self.dtype)
+            self.dy2 = np.empty(H, dtype=self.dtype)
+            self.x2 = np.empty(W)
+            self.y2 = np.empty(H)
+            self._scratch.clear()
+        if self.xs is None or not (np.array_equal(self.xs, xs) and np.array_equal(self.ys, ys)):
+            self.xs, self.ys = xs.copy(), ys.copy()
+            np.square(xs, out=self.x2)
+            np.square(ys, out=self.y2)
+            self._mask_R = None
+
+    def evaluate(self, p, xs, ys, workers=1):
+        """E на сетке ys × xs, вне круга 0"""
+        self._resize(xs, ys)
+        S = point_sources(p)
+        if len(S) == 1:
+            self._single(p, xs, ys)
+        else:
+            self._batched(S, xs, ys, workers)
+
+        # y² + x² > R² в том же порядке и типе, что прежний np.add.outer: граница круга
+        # не сдвигается ни на пиксель (форма x² > R² - y² округляется иначе).
+        # Маска зависит только от сетки и R — при движении источника она не пересчитывается
+        if self._mask_R != p['R']:
+            np.add(self.y2[:, None], self.x2[None, :], out=self.r2)
+            np.greater(self.r2, p['R'] ** 2, out=self.outside)
+            self._mask_R = p['R']
+        np.copyto(self.E, 0, where=self.outside)
+        return self.E
+
+    def _single(self, p, xs, ys):
+        E, dx2, dy2 = self.E, self.dx2, self.dy2
+        z2 = p['zL'] ** 2
+
+        dx, dy = self.dx, self.dy
+        np.subtract(xs, p['xL'], out=dx)
+        np.square(dx, out=dx)
+        dx2[:] = dx
+        np.subtract(ys, p['yL'], out=dy)
+        np.square(dy, out=dy)
+        dy += z2
+        dy2[:] = dy
+
+        np.add(dy2[:, None], dx2[None, :], out=E)  # r²
+        np.square(E, out=E)
+        np.divide(self.dtype(p['I0'] * 1e6 * z2), E, out=E)
+
+    def _batched(self, S, xs, ys, workers):
+        H, W = self.E.shape
+        z2 = S[:, 2, None] ** 2
+        # таблицы по источникам: dx² (N, W), dy² + z² (N, H), числитель (N,)
+        DX2 = np.square(xs - S[:, 0, None]).astype(self.dtype)
+        DY2 = (np.square(ys - S[:, 1, None]) + z2).astype(self.dtype)
+        K = (S[:, 3, None] * 1e6 * z2).astype(self.dtype)[:, :, None]
+
+        rows = max(1, min(H, CHUNK // W))
+        n_src = max(1, min(len(S), CHUNK // (rows * W)))
+        blocks = [(r0, min(r0 + rows, H)) for r0 in range(0, H, rows)]
+
+        def run(block, scratch):
+            r0, r1 = block
+            out = self.E[r0:r1]
+            out[:] = 0
+            for s0 in range(0, len(S), n_src):
+                s1 = min(s0 + n_src, len(S))
+                tmp = scratch[:s1 - s0, :r1 - r0]
+                np.add(DY2[s0:s1, r0:r1, None], DX2[s0:s1, None, :], out=tmp)  # r²
+                np.square(tmp, out=tmp)
+                np.divide(K[s0:s1], tmp, out=tmp)
+                out += tmp.sum(axis=0)
+
+        if workers <= 1 or len(blocks) == 1:
+            scratch = self._get_scratch(0, n_src, rows, W)
+            for block in blocks:
+                run(block, scratch)
+            return
+        if self._pool is None or self._workers != workers:
+            if self._pool is not None:
+                self._pool.shutdown()
+            self._pool = ThreadPoolExecutor(max_workers=workers)
+            self._workers = workers
+        # у каждого потока свой буфер: блоки раздаются по кругу и идут в потоке подряд
+        groups = [blocks[k::workers] for k in range(workers)]
+        jobs = [self._pool.submit(lambda k=k: [run(b, self._get_scratch(k, n_src, rows, W)) for b in groups[k]])
+                for k in range(workers) if groups[k]]
+        for job in jobs:
+            job.result()
+
+    def _get_scratch(self, k, n_src, rows, W):
+        buf = self._scratch.get(k)
+        if buf is None or buf.shape[0] < n_src or buf.shape[1] < rows or buf.shape[2] != W:
+            buf = self._scratch[k] = np.empty((n_src, rows, W), dtype=self.dtype)
+        return buf
+
+
+def heatmap(p, xs, ys, dtype=np.float32, workers=1):
+    """E на сетке ys × xs, вне круга 0 (разовый расчёт в новых буферах)"""
+    return HeatmapBuffers(dtype).evaluate(p, xs, ys, workers)
+
+
+def grid_stats(p, xs, ys):
+    """Прежняя статистика по пикселям сетки (min/max/среднее по маске круга)"""
+    E = heatmap(p, xs, ys, dtype=np.float64)
+    inside = E[np.add.outer(np.square(ys), np.square(xs)) <= p['R'] ** 2]
+    return {
+        'center': E_at(0.0, 0.0, p),
+        'edge_x': E_at(p['R'], 0.0, p),
+        'edge_y': E_at(0.0, p['R'], p),
+        'max': E.max(),
+        'min': inside.min(),
+        'mean': inside.mean(),
+    }
+
+
+def section(p, x, y):
+    """Сечение поля: x или y — вектор координат, другая — число (вне круга 0)"""
+    x, y = np.broadcast_arrays(x, y)
+    if p.get('sources') is not None and len(p['sources']):
+        E = field(point_sources(p), x, y)
+    else:
+        E = E_foot(np.square(x - p['xL']) + np.square(y - p['yL']), p)
+    E[x * x + y * y > p['R'] ** 2] = 0
+    return E
@@ -1,13 +1,30 @@
 # lr3_akg_perfect_square_pixels.py
 # Тепловая карта с квадратными пикселями и динамическим размером
 
+import os
+import time
+
 import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from matplotlib.figure import Figure
+from matplotlib.transforms import Bbox
 import tkinter as tk
 from tkinter import ttk
 
+from illuminance import (EXTREMA_GRID, SCENE_SIZE, HeatmapBuffers, disk_stats, expand_sources, extrema_exact,
+                         grid_stats, parse_sources, pixel_axes, section)
+from export import export_field
+from scheduler import UpdateScheduler
+
+# доля высоты фигуры под тепловой картой (верхний ряд сетки 2×2, квадратные пиксели)
+HEATMAP_FRACTION = 0.3
+# сводка — самый дорогой артист (текст раскладывается заново), при перетаскивании
+# она перерисовывается не чаще раза в INFO_INTERVAL_MS, последнее значение — всегда
+INFO_INTERVAL_MS = 250
+# целевое время кадра: при перетаскивании слайдера перерисовка не чаще ~30 раз в секунду
+FRAME_MS = 33
+
 
 class LightingLabPerfect:
     def __init__(self, root):
@@ -26,15 +43,39 @@ class LightingLabPerfect:
         }
 
 
-        self.base_scene_size = 2000.0
+        self.base_scene_size = SCENE_SIZE
+        # буферы карты живут между обновлениями и пересоздаются только при смене W/H
+        self.buffers = HeatmapBuffers()
+        # аналитическая статистика не зависит от W×H; иначе — по пикселям сетки, как раньше
+        self.analytic = tk.BooleanVar(value=True)
+        # дополнительные источники: точечные и протяжённые (раскладываются в узлы квадратуры)
+        self.sources_str = tk.StringVar(value="")
+        self._sources_cache = (None, None)
+        # пачки источников × строк карты раздаются потокам
+        self.multicore = tk.BooleanVar(value=False)
+
+        # запросы от всех переменных сливаются в один кадр; одинаковые кадры пропускаются
+        self.scheduler = UpdateScheduler(self.root, self.update_plot, self.param_key, FRAME_MS)
 
         self.create_widgets()
         self.setup_plot()
 
-        for var in self.vars.values():
-            var.trace_add("write", lambda *args: self.root.after_idle(self.update_plot))
+        for var in (*self.vars.values(), self.analytic, self.sources_str, self.multicore):
+            var.trace_add("write", self.scheduler.request)
+
+        self.scheduler.render_now()
 
-        self.update_plot()
+    def param_key(self):
+        """Всё, от чего зависит кадр; Scale пишет дробные W/H, но IntVar отдаёт целые"""
+        return tuple(var.get() for var in self.vars.values()) + (self.analytic.get(), self.sources_str.get(),
+                                                                 self.multicore.get())
+
+    def extra_sources(self):
+        """Дополнительные источники как точечные (N, 4); разбор строки кешируется"""
+        text = self.sources_str.get()
+        if self._sources_cache[0] != text:
+            self._sources_cache = (text, expand_sources(parse_sources(text)))
+        return self._sources_cache[1]
 
     def create_widgets(self):
         left = ttk.Frame(self.root, padding="15")
@@ -74,18 +115,142 @@ class LightingLabPerfect:
             else:
                 self.labels[key].config(text=f"{var.get():.1f}")
 
-        ttk.Button(left, text="Сохранить PNG", command=self.save).grid(row=len(params) + 1, column=0, columnspan=3,
-                                                                       pady=20)
+        ttk.Checkbutton(left, text="Аналитическая статистика (без сетки W×H)",
+                        variable=self.analytic).grid(row=len(params) + 1, column=0, columnspan=3, sticky="w")
+        ttk.Checkbutton(left, text="Считать на всех ядрах",
+                        variable=self.multicore).grid(row=len(params) + 2, column=0, columnspan=3, sticky="w")
+        ttk.Label(left, text="Доп. источники [x,y,z,I0]; rect[x,y,z,I0,a,b]; disk[x,y,z,I0,r]:").grid(
+            row=len(params) + 3, column=0, columnspan=3, sticky="w", pady=(10, 0))
+        ttk.Entry(left, textvariable=self.sources_str, width=48).grid(row=len(params) + 4, column=0, columnspan=3,
+                                                                      sticky="we")
+        ttk.Button(left, text="Сохранить PNG", command=self.save).grid(row=len(params) + 5, column=0, columnspan=3,
+                                                                       pady=(20, 4))
+        ttk.Button(left, text="Экспорт E (.npy + .json)", command=self.export).grid(row=len(params) + 6, column=0,
+                                                                                  columnspan=3, pady=(0, 20))
+        self.profile_label = ttk.Label(left, text="", foreground="gray")
+        self.profile_label.grid(row=len(params) + 7, column=0, columnspan=3, sticky="w")
 
     def setup_plot(self):
+        """Фигура строится один раз; обновления меняют данные артистов и перерисовывают только их.
+
+        Меняющиеся артисты помечены animated: полная отрисовка рисует без них фон (оси,
+        подписи, сетку), он запоминается, а на каждом обновлении фон восстанавливается,
+        поверх рисуются только эти артисты, и в окно копируются нужные области (blit).
+        """
         self.fig = Figure(figsize=(14, 9), dpi=100)
         self.canvas = FigureCanvasTkAgg(self.fig, self.root)
         self.canvas.get_tk_widget().grid(row=0, column=1, sticky="nsew")
         self.root.grid_columnconfigure(1, weight=1)
         self.root.grid_rowconfigure(0, weight=1)
 
+        scene_W = scene_H = self.base_scene_size
+        extent = [-scene_W / 2, scene_W / 2, -scene_H / 2, scene_H / 2]
+
+        # Тепловая карта
+        self.ax1 = self.fig.add_subplot(2, 2, (1, 2))
+        self.image = self.ax1.imshow(np.zeros((1, 1), dtype=np.float32), extent=extent, origin='lower',
+                                     interpolation='none', cmap='hot', vmin=0, vmax=1, animated=True)
+        self.circle = plt.Circle((0, 0), 1.0, color='cyan', fill=False, lw=2, ls='--', animated=True)
+        self.ax1.add_patch(self.circle)
+        self.star, = self.ax1.plot([], [], 'yellow', marker='*', markersize=16, markeredgecolor='black', mew=1,
+                                   animated=True)
+        self.extra_marks, = self.ax1.plot([], [], 'o', color='yellow', markersize=4, markeredgecolor='black',
+                                          mew=0.5, animated=True)
+        self.ax1.set_xlim(extent[0], extent[1])
+        self.ax1.set_ylim(extent[2], extent[3])
+        self.ax1.set_xlabel('X, мм')
+        self.ax1.set_ylabel('Y, мм')
+        self.ax1.set_aspect('equal', adjustable='box')
+
+        # Сечение по X
+        self.ax2 = self.fig.add_subplot(2, 2, 3)
+        self.line_x, = self.ax2.plot([], [], animated=True)
+        self.ax2.set_xlim(-scene_W / 2, scene_W / 2)
+        self.ax2.set_title('Сечение по X (Y = 0)')
+        self.ax2.set_xlabel('X, мм')
+        self.ax2.set_ylabel('E, лк')
+        self.ax2.grid(True, alpha=0.3)
+
+        # Сечение по Y
+        self.ax3 = self.fig.add_subplot(2, 2, 4)
+        self.line_y, = self.ax3.plot([], [], animated=True)
+        self.ax3.set_xlim(-scene_H / 2, scene_H / 2)
+        self.ax3.set_title('Сечение по Y (X = 0)')
+        self.ax3.set_xlabel('Y, мм')
+        self.ax3.set_ylabel('E, лк')
+        self.ax3.grid(True, alpha=0.3)
+
+        self.fig.suptitle("ЛР№3 — Освещённость от точечного источника", fontsize=14)
+        self.info = self.fig.text(0.01, 0.01, "", fontsize=10.5, va='bottom', animated=True,
+                                  bbox=dict(boxstyle="round,pad=0.7", facecolor="#f0f0f0"))
+
+        self.animated = [self.image, self.circle, self.star, self.extra_marks, self.line_x, self.line_y, self.info]
+        self.background = None
+        self.layout_key = None
+        self._info_time = 0.0
+        self._info_after_id = None
+        self._info_box = None
+        # после любой полной отрисовки (в том числе при изменении размера окна) фон запоминается заново
+        self.canvas.mpl_connect('draw_event', self.on_draw)
+
+    def on_draw(self, event):
+        if self.canvas.is_saving():
+            return
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        for artist in self.animated:
+            self.fig.draw_artist(artist)
+        self._info_box = self.info.get_bbox_patch().get_window_extent()
+
+    def blit(self):
+        """Фон + артисты осей; в окно копируются только области осей, сводка — по таймеру"""
+        self.canvas.restore_region(self.background)
+        for artist in self.animated[:-1]:
+            self.fig.draw_artist(artist)
+        for ax in (self.ax1, self.ax2, self.ax3):
+            self.canvas.blit(ax.bbox)
+
+        wait_ms = INFO_INTERVAL_MS - (time.perf_counter() - self._info_time) * 1000
+        if wait_ms <= 0:
+            self.flush_info()
+        elif self._info_after_id is None:
+            self._info_after_id = self.root.after(int(wait_ms) + 1, self.flush_info)
+
+    def flush_info(self):
+        """Перерисовывает только рамку сводки: стирает старый текст фоном, рисует новый"""
+        if self._info_after_id is not None:
+            self.root.after_cancel(self._info_after_id)
+            self._info_after_id = None
+        self._info_time = time.perf_counter()
+        old_box = self._info_box.expanded(1.0, 1.0).padded(2)
+        # restore_region считает строки сверху, а координаты фигуры — снизу;
+        # xy — угол всего сохранённого фона (он снят с целой фигуры)
+        height = self.fig.bbox.height
+        x1, y1, x2, y2 = old_box.extents
+        self.canvas.restore_region(self.background, bbox=(x1, height - y2, x2, height - y1), xy=(0, 0))
+        self.fig.draw_artist(self.info)
+        self._info_box = self.info.get_bbox_patch().get_window_extent()
+        self.canvas.blit(Bbox.union([old_box, self._info_box.padded(2)]))
+
+    @staticmethod
+    def fit_ylim(ax, top):
+        """Верх оси подгоняется только при выходе за пределы [0.5, 1] от текущего — иначе
+        менялись бы подписи делений и каждое обновление требовало полной перерисовки"""
+        top = top or 1.0
+        lo, hi = ax.get_ylim()
+        if top > hi or top < 0.5 * hi:
+            ax.set_ylim(-0.05 * top, 1.05 * top)
+            return True
+        return False
+
+    def display_step(self, Wres, Hres):
+        """Во сколько раз проредить сетку, чтобы на экранный пиксель приходилось не больше одного"""
+        fig_w, fig_h = self.canvas.get_width_height()
+        side = max(1, int(min(fig_w, fig_h * HEATMAP_FRACTION)))
+        return max(1, -(-max(Wres, Hres) // side))
+
     def calculate(self):
         p = {k: v.get() for k, v in self.vars.items()}
+        p['sources'] = self.extra_sources()
         Wres = int(p['W'])
         Hres = int(p['H'])
 
@@ -94,50 +259,20 @@ class LightingLabPerfect:
         scene_H = self.base_scene_size
 
         # Координаты центров пикселей в ММ
-        x = np.linspace(-scene_W / 2, scene_W / 2, Wres)
-        y = np.linspace(-scene_H / 2, scene_H / 2, Hres)
-        X, Y = np.meshgrid(x, y)
-
-        dx = X - p['xL']
-        dy = Y - p['yL']
-        dz = p['zL']
-
-        r = np.sqrt(dx ** 2 + dy ** 2 + dz ** 2)
-        cos_theta = dz / r
-
-        # Физически корректная формула освещённости
-        E = p['I0'] * (cos_theta ** 2) / (r / 1000.0) ** 2
-
-        # Маска круга
-        mask = X ** 2 + Y ** 2 <= p['R'] ** 2
-
-        # ФИЗИЧЕСКОЕ поле освещённости (вне круга = 0)
-        E_phys = np.zeros_like(E)
-        E_phys[mask] = E[mask]
-
-        # Нормализация ТОЛЬКО для изображения
-        E_norm = np.zeros_like(E)
-        E_norm[mask] = E[mask] / np.max(E[mask])
-        E_img = plt.cm.hot(E_norm)[:, :, :3]
+        x, y = pixel_axes(Wres, Hres)
 
         # Статистика (строго по физике)
-        ix0 = np.argmin(np.abs(x))
-        iy0 = np.argmin(np.abs(y))
-        ixR = np.argmin(np.abs(x - p['R']))
-        iyR = np.argmin(np.abs(y - p['R']))
-
-        stats = {
-            'center': self.E_at(0.0, 0.0, p),
-            'edge_x': self.E_at(p['R'], 0.0, p),
-            'edge_y': self.E_at(0.0, p['R'], p),
-            'max': np.max(E_phys),  # это уже по дискретной карте
-            'min': np.min(E_phys[mask]),
-            'mean': np.mean(E_phys[mask]),
-        }
+        stats = disk_stats(p) if self.analytic.get() else grid_stats(p, x, y)
+
+        # Картинка — только те пиксели сетки, что видны на экране; float32, без RGBA-копии:
+        # цвета накладывает сам imshow через cmap и vmin/vmax
+        step = self.display_step(Wres, Hres)
+        workers = (os.cpu_count() or 1) if self.multicore.get() else 1
+        E_img = self.buffers.evaluate(p, x[::step], y[::step], workers)
 
         return (
             E_img,
-            E_phys,
+            step,
             x,
             y,
             stats,
@@ -148,78 +283,85 @@ class LightingLabPerfect:
             scene_H
         )
 
-    def E_at(self, x_mm, y_mm, p):
-        dx = x_mm - p['xL']
-        dy = y_mm - p['yL']
-        dz = p['zL']
-        r_mm = (dx * dx + dy * dy + dz * dz) ** 0.5
-        cos_theta = dz / r_mm
-        E = p['I0'] * (cos_theta ** 2) / ((r_mm / 1000.0) ** 2)
-        return E
-
     def update_plot(self):
-        self.fig.clear()
-        E_img, E_full, x_line, y_line, stats, p, Wres, Hres, scene_W, scene_H = self.calculate()
+        E_img, step, x_line, y_line, stats, p, Wres, Hres, scene_W, scene_H = self.calculate()
 
         # Тепловая карта
-        ax1 = self.fig.add_subplot(2, 2, (1, 2))
-        ax1.imshow(E_img, extent=[-scene_W / 2, scene_W / 2, -scene_H / 2, scene_H / 2],
-                   origin='lower', interpolation='none')
-        circle = plt.Circle((0, 0), p['R'], color='cyan', fill=False, lw=2, ls='--')
-        ax1.add_patch(circle)
-        ax1.plot(p['xL'], p['yL'], 'yellow', marker='*', markersize=16, markeredgecolor='black', mew=1)
-        ax1.set_title(f'Тепловая карта {Wres}×{Hres} пикселей')
-        ax1.set_xlabel('X, мм')
-        ax1.set_ylabel('Y, мм')
-        ax1.set_aspect('equal', adjustable='box')
-
-        Ex = E_full[Hres // 2, :]
-        Ey = E_full[:, Wres // 2]
-
-        # обнуление вне круга
-        Ex[np.abs(x_line) > p['R']] = 0
-        Ey[np.abs(y_line) > p['R']] = 0
-
-        # Сечение по X
-        ax2 = self.fig.add_subplot(2, 2, 3)
-        ax2.plot(x_line, Ex)
-        ax2.set_xlim(-scene_W / 2, scene_W / 2)
-        ax2.set_title('Сечение по X (Y = 0)')
-        ax2.set_xlabel('X, мм')
-        ax2.set_ylabel('E, лк')
-        ax2.grid(True, alpha=0.3)
-
-        # Сечение по Y
-        ax3 = self.fig.add_subplot(2, 2, 4)
-        ax3.plot(y_line, Ey)
-        ax3.set_xlim(-scene_H / 2, scene_H / 2)
-        ax3.set_title('Сечение по Y (X = 0)')
-        ax3.set_xlabel('Y, мм')
-        ax3.set_ylabel('E, лк')
-        ax3.grid(True, alpha=0.3)
-
-        txt = (f"Источник: ({p['xL']:.1f}, {p['yL']:.1f}, {p['zL']:.0f}) мм | I₀ = {p['I0']:.0f} кд\n"
+        self.image.set_data(E_img)
+        self.image.set_extent([-scene_W / 2, scene_W / 2, -scene_H / 2, scene_H / 2])
+        self.image.set_clim(0, stats['max'] or 1.0)
+        self.circle.set_radius(p['R'])
+        self.star.set_data([p['xL']], [p['yL']])
+        self.extra_marks.set_data(p['sources'][:, 0], p['sources'][:, 1])
+
+        # сечения через средние строку и столбец сетки; вне круга 0
+        Ex = section(p, x_line, y_line[Hres // 2])
+        Ey = section(p, x_line[Wres // 2], y_line)
+        self.line_x.set_data(x_line, Ex)
+        self.line_y.set_data(y_line, Ey)
+
+        extra = f" | доп. точечных источников: {len(p['sources'])}" if len(p['sources']) else ""
+        # с доп. источниками min/max — результат поиска, а не формула: пик уже шага стартовой сетки
+        # может быть пропущен, протяжённые излучатели заменены узлами квадратуры;
+        # пояснение встаёт на место пустой строки, чтобы рамка сводки не росла
+        eq, note = "=", ""
+        if self.analytic.get() and not extrema_exact(p):
+            eq = "≈"
+            note = (f"≈: Eₘₐₓ/Eₘᵢₙ — поиск по области (шаг стартовой сетки "
+                    f"{2 * min(p['R'], scene_W / 2) / (EXTREMA_GRID - 1):.0f} мм), излучатели — узлы квадратуры")
+        txt = (f"Источник: ({p['xL']:.1f}, {p['yL']:.1f}, {p['zL']:.0f}) мм | I₀ = {p['I0']:.0f} кд{extra}\n"
                f"Радиус R = {p['R']:.0f} мм\n"
                f"Разрешение: W×H = {Wres}×{Hres} пикселей\n"
-               f"Физический размер сцены: {scene_W:.0f}×{scene_H:.0f} мм\n\n"
+               f"Физический размер сцены: {scene_W:.0f}×{scene_H:.0f} мм\n{note}\n"
                f"E(0,0) = {stats['center']:.2f} лк | E(R,0) = {stats['edge_x']:.2f} лк | E(0,R) = {stats['edge_y']:.2f} лк\n"
-               f"Eₘₐₓ = {stats['max']:.2f} лк | Eₘᵢₙ = {stats['min']:.2f} лк | Eₛᵣ = {stats['mean']:.2f} лк")
-
-        self.fig.suptitle("ЛР№3 — Освещённость от точечного источника", fontsize=14)
-        self.fig.text(0.01, 0.01, txt, fontsize=10.5, va='bottom',
-                      bbox=dict(boxstyle="round,pad=0.7", facecolor="#f0f0f0"))
-
-        self.fig.tight_layout(rect=[0, 0.14, 1, 0.94])
-        self.canvas.draw()
+               f"Eₘₐₓ {eq} {stats['max']:.2f} лк | Eₘᵢₙ {eq} {stats['min']:.2f} лк | Eₛᵣ = {stats['mean']:.2f} лк")
+        self.info.set_text(txt)
+
+        frames = self.scheduler.stats()
+        if frames["frames"]:
+            self.profile_label.config(text=f"кадр {frames['mean_ms']:.1f} мс (p95 {frames['p95_ms']:.1f}), "
+                                           f"запросов {frames['requests']} → кадров {frames['frames']}")
+
+        # полная перерисовка — только если поменялось что-то в фоне: заголовок или шкалы сечений
+        rescaled = self.fit_ylim(self.ax2, Ex.max())
+        rescaled |= self.fit_ylim(self.ax3, Ey.max())
+        layout_key = (Wres, Hres, step)
+        if rescaled or layout_key != self.layout_key or self.background is None:
+            self.layout_key = layout_key
+            shown = f' (на экране каждый {step}-й)' if step > 1 else ''
+            self.ax1.set_title(f'Тепловая карта {Wres}×{Hres} пикселей{shown}')
+            self.fig.tight_layout(rect=[0, 0.14, 1, 0.94])
+            self.canvas.draw()
+        else:
+            self.blit()
 
     def save(self):
         from datetime import datetime
         fn = f"LR3_{datetime.now().strftime('%Y%m%d_%H%M%S')}.png"
-        self.fig.savefig(fn, dpi=300, bbox_inches='tight', facecolor='white')
+        # animated-артисты figure.savefig пропускает — на время сохранения они обычные
+        for artist in self.animated:
+            artist.set_animated(False)
+        try:
+            self.fig.savefig(fn, dpi=300, bbox_inches='tight', facecolor='white')
+        finally:
+            for artist in self.animated:
+                artist.set_animated(True)
+        self.canvas.draw()
         print(f"Сохранено: {fn}")
 
+    def export(self):
+        """Полная сетка W×H (без прореживания для экрана) в .npy с координатами и .json с параметрами"""
+        from datetime import datetime
+        p = {k: v.get() for k, v in self.vars.items()}
+        p['sources'] = self.extra_sources()
+        base = f"LR3_E_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        workers = (os.cpu_count() or 1) if self.multicore.get() else 1
+        paths = export_field(base, p, int(p['W']), int(p['H']), workers=workers)
+        print(f"Выгружено: {paths['E']}, {paths['meta']}")
+
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = LightingLabPerfect(root)
     root.mainloop()
+    print(app.scheduler.summary())
@@ -0,0 +1,87 @@
+import time
+from collections import deque
+
+import numpy as np
+
+
+class UpdateScheduler:
+    """Перерисовка по запросам от trace-колбэков: не чаще раза в frame_ms.
+
+    Все запросы, пришедшие до начала кадра, сливаются в один; кадр с тем же
+    ключом параметров, что у последнего нарисованного, пропускается.
+    В history копится (начало, длительность в мс, сколько запросов слито в кадр).
+    """
+
+    def __init__(self, root, render, key, frame_ms=33, history=500):
+        self.root = root
+        self.render = render
+        self.key = key
+        self.frame_ms = frame_ms
+        self.history = deque(maxlen=history)
+        self.requests = 0
+        self.skipped = 0
+
+        self._after_id = None
+        self._pending = 0
+        self._last_key = None
+        self._last_start = float("-inf")
+
+    def request(self, *_):
+        """Колбэк для trace_add: планирует кадр, если он ещё не запланирован"""
+        self.requests += 1
+        self._pending += 1
+        if self._after_id is not None:
+            return
+        wait_ms = self.frame_ms - (time.perf_counter() - self._last_start) * 1000
+        if wait_ms > 0:
+            self._after_id = self.root.after(int(wait_ms) + 1, self._run)
+        else:
+            # after_idle: сначала Tk досчитает остальные изменения переменных этого события
+            self._after_id = self.root.after_idle(self._run)
+
+    def render_now(self):
+        """Нарисовать сразу, минуя очередь (например, при запуске)"""
+        if self._after_id is not None:
+            self.root.after_cancel(self._after_id)
+        self._run()
+
+    def _run(self):
+        self._after_id = None
+        try:
+            key = self.key()
+        except Exception:
+            # поле ввода сейчас не разбирается (пустое, «-» и т.п.) — ждём следующего изменения
+            self._pending = 0
+            return
+        if key == self._last_key:
+            self.skipped += 1
+            self._pending = 0
+            return
+
+        t0 = time.perf_counter()
+        self._last_start = t0
+        self.render()
+        self.history.append((t0, (time.perf_counter() - t0) * 1000, self._pending))
+        self._last_key = key
+        self._pending = 0
+
+    def stats(self):
+        """Сводка по истории кадров: число, среднее, p95 и максимум времени кадра"""
+        ms = np.array([h[1] for h in self.history])
+        if not len(ms):
+            return {"frames": 0, "requests": self.requests, "skipped": self.skipped}
+        return {
+            "frames": len(ms),
+            "requests": self.requests,
+            "skipped": self.skipped,
+            "mean_ms": float(ms.mean()),
+            "p95_ms": float(np.percentile(ms, 95)),
+            "max_ms": float(ms.max()),
+        }
+
+    def summary(self):
+        s = self.stats()
+        if not s["frames"]:
+            return f"кадров нет, запросов {s['requests']}"
+        return (f"кадров {s['frames']} на {s['requests']} запросов (пропущено {s['skipped']}), "
+                f"кадр {s['mean_ms']:.1f} мс, p95 {s['p95_ms']:.1f}, макс {s['max_ms']:.1f}")
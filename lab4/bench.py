@@ -0,0 +1,130 @@
+"""Сравнение векторного рендера с прежним попиксельным циклом: время и расхождение.
+Вторая таблица — сотни источников: стоимость освещения (источники × пиксели)
+и время без отсечения и с отсечением по тайлам при разных порогах.
+
+Запуск: python bench.py
+"""
+import time
+
+import numpy as np
+
+from renderer import H_mm, R, W_mm, center, parse_lights, render, render_brightness, screen_z
+
+LIGHTS = "[-600,-500,1500,12000];[700,-400,1600,12000]"
+Z_OBS = 3000.0
+KD, KS, SHININESS = 0.5, 0.8, 200.0
+
+N_LIGHTS = 400
+THRESHOLDS = (1e-5, 1e-4, 1e-3)
+
+
+def normalize(v):
+    n = np.linalg.norm(v)
+    return v / n if n > 1e-8 else np.zeros(3)
+
+
+def render_brightness_loop(Wres, Hres, z_obs, lights, kd, ks, shininess):
+    """Исходная версия: цикл по пикселям и источникам на Python"""
+    observer_pos = np.array([0.0, 0.0, z_obs])
+    brightness = np.zeros((Hres, Wres))
+    for j in range(Hres):
+        for i in range(Wres):
+            pixel_size = max(W_mm / Wres, H_mm / Hres)
+            screen_w = pixel_size * Wres
+            screen_h = pixel_size * Hres
+
+            x = -screen_w / 2 + (i + 0.5) * pixel_size
+            y = screen_h / 2 - (j + 0.5) * pixel_size
+
+            screen_pt = np.array([x, y, screen_z])
+            dir_vec = screen_pt - observer_pos
+
+            oc = observer_pos - center
+            a = np.dot(dir_vec, dir_vec)
+            b = 2 * np.dot(dir_vec, oc)
+            c = np.dot(oc, oc) - R * R
+
+            disc = b * b - 4 * a * c
+            if disc < 0:
+                continue
+
+            sqrt_d = np.sqrt(disc)
+            t = (-b - sqrt_d) / (2 * a)
+            if t <= 0:
+                t = (-b + sqrt_d) / (2 * a)
+                if t <= 0:
+                    continue
+
+            P = observer_pos + t * dir_vec
+            N = normalize(P - center)
+            V = normalize(observer_pos - P)
+            if np.dot(N, V) <= 0:
+                continue
+
+            bright = 0.0
+            for light in lights:
+                L_vec = light["pos"] - P
+                dist = np.linalg.norm(L_vec)
+                if dist < 1e-6:
+                    continue
+
+                L = L_vec / dist
+                H = normalize(L + V)
+
+                diff = kd * max(np.dot(N, L), 0)
+                spec = ks * (max(np.dot(N, H), 0) ** shininess)
+
+                bright += (diff + spec) * light["I0"] / (dist * dist)
+
+            brightness[j, i] = bright
+    return brightness
+
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+
+def main():
+    lights = parse_lights(LIGHTS)
+    print(f"{'разрешение':>12} {'цикл, с':>9} {'numpy, мс':>10} {'ускорение':>10} {'макс. отн. ошибка':>18}")
+    for Wres, Hres in [(150, 100), (300, 200), (500, 500)]:
+        args = (Wres, Hres, Z_OBS, lights, KD, KS, SHININESS)
+        ref, t_loop = timed(render_brightness_loop, *args)
+        out, t_vec = timed(render_brightness, *args)
+        err = np.abs(out - ref).max() / ref.max()
+        print(f"{Wres:>6}x{Hres:<5} {t_loop:>9.2f} {t_vec * 1000:>10.1f} {t_loop / t_vec:>9.0f}x {err:>18.2e}")
+
+
+def random_lights(n, seed=1):
+    """n источников вокруг сферы на расстоянии 350..3000 мм от центра, I0 от 20 до 400"""
+    rng = np.random.default_rng(seed)
+    dirs = rng.normal(size=(n, 3))
+    dirs /= np.linalg.norm(dirs, axis=1)[:, None]
+    pos = center + dirs * rng.uniform(350, 3000, n)[:, None]
+    I0 = rng.uniform(20, 400, n)
+    return ";".join(f"[{x:.1f},{y:.1f},{z:.1f},{i:.1f}]" for (x, y, z), i in zip(pos, I0))
+
+
+def culling():
+    params = {"z": Z_OBS, "kd": KD, "ks": KS, "shininess": SHININESS, "lights": random_lights(N_LIGHTS)}
+    print(f"\n{N_LIGHTS} источников, отсечение по тайлам:")
+    print(f"{'разрешение':>12} {'порог':>7} {'источники×пиксели':>28} {'мс':>8} {'ускорение':>10} "
+          f"{'отн. ошибка':>13}")
+    for Wres, Hres in [(150, 100), (300, 200)]:
+        p = dict(params, Wres=Wres, Hres=Hres)
+        stats = {}
+        ref, t_ref = timed(render, p, stats)
+        print(f"{Wres:>6}x{Hres:<5} {0:>7} {stats['dense']:>28} {t_ref * 1000:>8.0f} {1:>9.0f}x {0:>13.1e}")
+        for thr in THRESHOLDS:
+            stats = {}
+            out, t = timed(render, dict(p, light_threshold=thr), stats)
+            cost = f"{stats['dense']} → {stats['culled']} ({stats['culled'] / stats['dense']:.0%})"
+            print(f"{'':>12} {thr:>7} {cost:>28} {t * 1000:>8.0f} {t_ref / t:>9.1f}x "
+                  f"{np.abs(out - ref).max() / ref.max():>13.1e}")
+
+
+if __name__ == "__main__":
+    main()
+    culling()
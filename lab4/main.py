@@ -1,201 +1,240 @@
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 from PIL import Image, ImageTk
 import tkinter as tk
-import re
-
-# ==================== НАСТРОЙКИ ====================
-
-
-# параметры по умолчанию
-kd = 0.5
-ks = 0.8
-shininess = 200.0
-
-Wres = 150
-Hres = 100
-
-center = np.array([0.0, 0.0, 1000.0])  # центр сферы
-R = 300.0  # радиус сферы
-
-W_mm = 500.00
-H_mm = 300.0
-screen_z = 0.0
-
-initial_z = 3000.0
-initial_lights = "[-600,-500,1500,12000];[700,-400,1600,12000]"
-
-root = tk.Tk()
-root.title("ЛР4 — Сфера Блинн-Фонг (камера + источники света)")
-
-# ==================== ПЕРЕМЕННЫЕ GUI ====================
-z_var = tk.DoubleVar(value=initial_z)
-lights_str = tk.StringVar(value=initial_lights)
-
-kd_var = tk.DoubleVar(value=kd)
-ks_var = tk.DoubleVar(value=ks)
-shininess_var = tk.DoubleVar(value=shininess)
-
-Wres_var = tk.IntVar(value=Wres)
-Hres_var = tk.IntVar(value=Hres)
-
-# ==================== ГРАФИЧЕСКИЙ ИНТЕРФЕЙС ====================
-
-def add_slider(label, var, frm, to, res):
-    tk.Label(root, text=label, font=("Arial", 12)).pack(pady=(10, 2))
-    fr = tk.Frame(root)
-    fr.pack()
-    tk.Scale(fr, from_=frm, to=to, resolution=res,
-             orient='horizontal', length=500, variable=var).pack(side='left')
-    tk.Entry(fr, textvariable=var, width=10).pack(side='left', padx=10)
-
-# Z наблюдателя
-add_slider("Z наблюдателя [мм]:", z_var, 800, 10000, 10)
-
-# Разрешение
-add_slider("Wres (горизонтальное разрешение):", Wres_var, 50, 500, 1)
-add_slider("Hres (вертикальное разрешение):", Hres_var, 50, 500, 1)
-
-# Коэффициенты модели освещения
-add_slider("kd (диффузный коэффициент):", kd_var, 0.0, 2.0, 0.01)
-add_slider("ks (зеркальный коэффициент):", ks_var, 0.0, 2.0, 0.01)
-add_slider("shininess (блеск):", shininess_var, 1, 10000, 10)
-
-# Источники света
-tk.Label(root, text="Источники света (формат: [x,y,z,I0];...):",
-         font=("Arial", 12)).pack(pady=(15, 5))
-
-entry_lights = tk.Entry(root, textvariable=lights_str,
-                        font=("Consolas", 11), width=70)
-entry_lights.pack(pady=5)
-
-btn = tk.Button(root, text="Пересчитать и обновить",
-                font=("Arial", 14), height=2)
-btn.pack(pady=10)
-
-label_img = tk.Label(root, bg="gray20")
-label_img.pack(padx=10, pady=10)
-
-
-# ==================== ЛОГИКА ====================
 
-def parse_lights(text):
-    lights = []
-    parts = text.replace(" ", "").split(';')
-    for part in parts:
-        if not part.strip():
-            continue
-        nums = re.findall(r'-?\d+\.?\d*', part)
-        if len(nums) == 4:
-            x, y, z, I0 = map(float, nums)
-            lights.append({"pos": np.array([x, y, z]), "I0": I0})
-    return lights
+from renderer import DEFAULT_PARAMS, iter_bands, iter_progressive, normalize_params, to_uint8
 
+# ==================== НАСТРОЙКИ ====================
 
-def normalize(v):
-    n = np.linalg.norm(v)
-    return v / n if n > 1e-8 else np.zeros(3)
-
-
-def render(*args):
-    global Wres, Hres, kd, ks, shininess
-
-    # --- обновляем параметры ---
-    Wres = int(Wres_var.get())
-    Hres = int(Hres_var.get())
-
-    kd = float(kd_var.get())
-    ks = float(ks_var.get())
-    shininess = float(shininess_var.get())
-
-    z_obs = z_var.get()
-    observer_pos = np.array([0.0, 0.0, z_obs])
-
-    try:
-        current_lights = parse_lights(lights_str.get())
-        if not current_lights:
+OUTPUT_PNG = "АКГ_лр4_сфера.png"
+DISPLAY_SCALE = 5
+BAND_ROWS = 8  # строк за шаг фонового рендера: между шагами проверяется, не устарел ли кадр
+SLIDER_DELAY_MS = 60
+POLL_MS = 30
+
+
+class Lab4App:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("ЛР4 — Сфера Блинн-Фонг (камера + источники света)")
+
+        # ==================== ПЕРЕМЕННЫЕ GUI ====================
+        self.z_var = tk.DoubleVar(value=DEFAULT_PARAMS["z"])
+        self.lights_str = tk.StringVar(value=DEFAULT_PARAMS["lights"])
+        self.threshold_var = tk.DoubleVar(value=DEFAULT_PARAMS["light_threshold"])
+
+        self.kd_var = tk.DoubleVar(value=DEFAULT_PARAMS["kd"])
+        self.ks_var = tk.DoubleVar(value=DEFAULT_PARAMS["ks"])
+        self.shininess_var = tk.DoubleVar(value=DEFAULT_PARAMS["shininess"])
+
+        self.Wres_var = tk.IntVar(value=DEFAULT_PARAMS["Wres"])
+        self.Hres_var = tk.IntVar(value=DEFAULT_PARAMS["Hres"])
+        self.progressive_var = tk.BooleanVar(value=True)
+
+        self.last_image = None
+
+        # Рендер идёт в отдельном потоке; каждый новый запрос увеличивает generation,
+        # и поток бросает кадр, как только видит, что его поколение устарело
+        self.generation = 0
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.results = queue.Queue()
+        self._poll_id = None
+        self._render_after_id = None
+        self._future = None
+
+        self.build_ui()
+
+        for var in (self.z_var, self.kd_var, self.ks_var, self.shininess_var, self.Wres_var, self.Hres_var,
+                    self.threshold_var):
+            var.trace_add("write", lambda *_: self.schedule_render())
+
+    # ==================== ГРАФИЧЕСКИЙ ИНТЕРФЕЙС ====================
+
+    def add_slider(self, label, var, frm, to, res):
+        tk.Label(self.root, text=label, font=("Arial", 12)).pack(pady=(10, 2))
+        fr = tk.Frame(self.root)
+        fr.pack()
+        tk.Scale(fr, from_=frm, to=to, resolution=res,
+                 orient='horizontal', length=500, variable=var).pack(side='left')
+        tk.Entry(fr, textvariable=var, width=10).pack(side='left', padx=10)
+
+    def build_ui(self):
+        # Z наблюдателя
+        self.add_slider("Z наблюдателя [мм]:", self.z_var, 800, 10000, 10)
+
+        # Разрешение
+        self.add_slider("Wres (горизонтальное разрешение):", self.Wres_var, 50, 500, 1)
+        self.add_slider("Hres (вертикальное разрешение):", self.Hres_var, 50, 500, 1)
+
+        # Коэффициенты модели освещения
+        self.add_slider("kd (диффузный коэффициент):", self.kd_var, 0.0, 2.0, 0.01)
+        self.add_slider("ks (зеркальный коэффициент):", self.ks_var, 0.0, 2.0, 0.01)
+        self.add_slider("shininess (блеск):", self.shininess_var, 1, 10000, 10)
+
+        # Источники света
+        tk.Label(self.root, text="Источники света (формат: [x,y,z,I0];...):",
+                 font=("Arial", 12)).pack(pady=(15, 5))
+
+        entry_lights = tk.Entry(self.root, textvariable=self.lights_str,
+                                font=("Consolas", 11), width=70)
+        entry_lights.pack(pady=5)
+
+        fr = tk.Frame(self.root)
+        fr.pack()
+        tk.Label(fr, text="Порог вклада источника (0 — без отсечения):",
+                 font=("Arial", 12)).pack(side='left')
+        tk.Entry(fr, textvariable=self.threshold_var, width=10).pack(side='left', padx=10)
+
+        btns = tk.Frame(self.root)
+        btns.pack(pady=10)
+        tk.Button(btns, text="Пересчитать и обновить", font=("Arial", 14), height=2,
+                  command=self.render).pack(side='left', padx=5)
+        tk.Button(btns, text="Сохранить PNG", font=("Arial", 14), height=2,
+                  command=self.save).pack(side='left', padx=5)
+
+        tk.Checkbutton(self.root, text="Прогрессивный рендер (1/8 → 1/4 → 1/2 → 1)",
+                       variable=self.progressive_var).pack()
+
+        self.progress = tk.Label(self.root, text="", font=("Consolas", 11))
+        self.progress.pack()
+
+        self.label_img = tk.Label(self.root, bg="gray20")
+        self.label_img.pack(padx=10, pady=10)
+
+    # ==================== ЛОГИКА ====================
+
+    def current_params(self):
+        return normalize_params({
+            "z": self.z_var.get(),
+            "Wres": self.Wres_var.get(),
+            "Hres": self.Hres_var.get(),
+            "kd": self.kd_var.get(),
+            "ks": self.ks_var.get(),
+            "shininess": self.shininess_var.get(),
+            "lights": self.lights_str.get(),
+            "light_threshold": self.threshold_var.get(),
+        })
+
+    def schedule_render(self):
+        if self._render_after_id is not None:
+            self.root.after_cancel(self._render_after_id)
+        self._render_after_id = self.root.after(SLIDER_DELAY_MS, self.render)
+
+    def render(self, *args):
+        self._render_after_id = None
+        try:
+            params = self.current_params()
+        except Exception:
+            print("Ошибка разбора параметров!")
+            return
+        if not params["lights"]:
             print("Ошибка: не найдено ни одного источника света!")
             return
-    except:
-        print("Ошибка парсинга источников света!")
-        return
-
-    print(f"\nПересчёт при Z={z_obs:.1f}, Wres={Wres}, Hres={Hres}, "
-          f"kd={kd}, ks={ks}, shininess={shininess}")
-
-    brightness = np.zeros((Hres, Wres))
-    max_b = 0.0
-    min_b = np.inf
-
-    for j in range(Hres):
-        for i in range(Wres):
-            pixel_size = max(W_mm / Wres, H_mm / Hres)
-            screen_w = pixel_size * Wres
-            screen_h = pixel_size * Hres
-
-            x = -screen_w / 2 + (i + 0.5) * pixel_size
-            y = screen_h / 2 - (j + 0.5) * pixel_size
 
-            screen_pt = np.array([x, y, screen_z])
-            dir_vec = screen_pt - observer_pos
-
-            oc = observer_pos - center
-            a = np.dot(dir_vec, dir_vec)
-            b = 2 * np.dot(dir_vec, oc)
-            c = np.dot(oc, oc) - R * R
-
-            disc = b * b - 4 * a * c
-            if disc < 0:
-                continue
-
-            sqrt_d = np.sqrt(disc)
-            t = (-b - sqrt_d) / (2 * a)
-            if t <= 0:
-                t = (-b + sqrt_d) / (2 * a)
-                if t <= 0:
-                    continue
-
-            P = observer_pos + t * dir_vec
-            N = normalize(P - center)
-            V = normalize(observer_pos - P)
-            if np.dot(N, V) <= 0:
+        print(f"\nПересчёт при Z={params['z']:.1f}, Wres={params['Wres']}, Hres={params['Hres']}, "
+              f"kd={params['kd']}, ks={params['ks']}, shininess={params['shininess']}")
+
+        self.generation += 1
+        job = self.progressive_job if self.progressive_var.get() else self.render_job
+        self._future = self.executor.submit(job, self.generation, params)
+        if self._poll_id is None:
+            self._poll_id = self.root.after(POLL_MS, self.poll_results)
+
+    def render_job(self, gen, params):
+        """Выполняется в потоке рендера; Tk отсюда не трогаем — только очередь"""
+        brightness = np.zeros((params["Hres"], params["Wres"]))
+        stats = {}
+        t0 = time.perf_counter()
+        for r0, band in iter_bands(params, BAND_ROWS, stats):
+            if gen != self.generation:
+                return
+            brightness[r0:r0 + len(band)] = band
+            self.results.put(("progress", gen, (r0 + len(band), len(brightness)), time.perf_counter() - t0))
+        self.results.put(("done", gen, (brightness, stats), time.perf_counter() - t0))
+
+    def progressive_job(self, gen, params):
+        """Как render_job, но кадр уточняется уровнями; каждый уровень сразу уходит на экран,
+        а поколение проверяется после каждой полосы уровня"""
+        stats = {}
+        t0 = time.perf_counter()
+        total = params["Wres"] * params["Hres"]
+        for step, preview, traced in iter_progressive(params, stats=stats, band_rows=BAND_ROWS):
+            if gen != self.generation:
+                return
+            if preview is None:
+                kind, payload = "pixels", (step, traced, total)
+            elif step == 1:
+                kind, payload = "done", (preview, stats)
+            else:
+                kind, payload = "level", (step, preview, traced)
+            self.results.put((kind, gen, payload, time.perf_counter() - t0))
+
+    def poll_results(self):
+        """Забирает результаты потока рендера в цикле Tk; устаревшие поколения пропускаются"""
+        self._poll_id = None
+        finished = False
+        while True:
+            try:
+                kind, gen, payload, elapsed = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if gen != self.generation:
                 continue
+            if kind == "progress":
+                rows, total = payload
+                self.progress.config(text=f"строк: {rows}/{total}, {elapsed * 1000 / rows:.2f} мс/строка")
+            elif kind == "pixels":
+                step, traced, total = payload
+                self.progress.config(text=f"уровень 1/{step}: пикселей {traced}/{total}, "
+                                          f"{elapsed * 1e6 / traced:.2f} мкс/пиксель")
+            elif kind == "level":
+                step, preview, traced = payload
+                self.progress.config(text=f"уровень 1/{step}: {traced} пикс., {elapsed * 1000:.0f} мс")
+                self.show(Image.fromarray(to_uint8(preview), mode="L"))
+            else:
+                finished = True
+                brightness, stats = payload
+                rows = brightness.shape[0]
+                cost = f"источники×пиксели: {stats.get('dense', 0)} → {stats.get('culled', 0)}"
+                self.progress.config(text=f"готово: {rows} строк за {elapsed * 1000:.0f} мс, "
+                                          f"{elapsed * 1000 / rows:.2f} мс/строка; {cost}")
+                print(f"Рендер: {elapsed * 1000:.1f} мс, {cost}")
+                self.show(Image.fromarray(to_uint8(brightness), mode="L"))
+        if not finished and self._future.done() and self._future.exception() is not None:
+            print(f"Ошибка рендера: {self._future.exception()}")
+            finished = True
+        if not finished:
+            self._poll_id = self.root.after(POLL_MS, self.poll_results)
+
+    def show(self, im):
+        self.last_image = im
+        im_display = im.resize((DISPLAY_SCALE * im.width, DISPLAY_SCALE * im.height), Image.NEAREST)
+        photo = ImageTk.PhotoImage(im_display)
+        self.label_img.config(image=photo)
+        self.label_img.image = photo
+
+    def save(self):
+        if self.last_image is None:
+            return
+        self.last_image.save(OUTPUT_PNG)
+        print(f"Изображение сохранено → {OUTPUT_PNG}")
 
-            bright = 0.0
-            for light in current_lights:
-                L_vec = light["pos"] - P
-                dist = np.linalg.norm(L_vec)
-                if dist < 1e-6:
-                    continue
-
-                L = L_vec / dist
-                H = normalize(L + V)
-
-                diff = kd * max(np.dot(N, L), 0)
-                spec = ks * (max(np.dot(N, H), 0) ** shininess)
-
-                bright += (diff + spec) * light["I0"] / (dist * dist)
-
-            brightness[j, i] = bright
-            max_b = max(max_b, bright)
-            if 0 < bright < min_b:
-                min_b = bright
-
-    if max_b == 0:
-        max_b = 1.0
-
-    img_array = (brightness / max_b * 255).clip(0, 255).astype(np.uint8)
-    im = Image.fromarray(img_array, mode="L")
-    im.save("АКГ_лр4_сфера.png")
-
-    print("Изображение сохранено → АКГ_лр4_сфера.png")
+    def close(self):
+        self.generation += 1  # текущий кадр бросается на ближайшей полосе
+        self.executor.shutdown(wait=False, cancel_futures=True)
 
-    im_display = im.resize((5*Wres, 5*Hres), Image.NEAREST)
-    photo = ImageTk.PhotoImage(im_display)
-    label_img.config(image=photo)
-    label_img.image = photo
 
+def main():
+    root = tk.Tk()
+    app = Lab4App(root)
+    app.render()
+    root.mainloop()
+    app.close()
 
-btn.config(command=render)
 
-render()
-root.mainloop()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,388 @@
+import re
+
+import numpy as np
+
+# ==================== СЦЕНА ====================
+
+center = np.array([0.0, 0.0, 1000.0])  # центр сферы
+R = 300.0  # радиус сферы
+
+W_mm = 500.00
+H_mm = 300.0
+screen_z = 0.0
+
+# параметры по умолчанию
+DEFAULT_PARAMS = {
+    "z": 3000.0,
+    "Wres": 150,
+    "Hres": 100,
+    "kd": 0.5,
+    "ks": 0.8,
+    "shininess": 200.0,
+    "lights": "[-600,-500,1500,12000];[700,-400,1600,12000]",
+    "light_threshold": 0.0,  # вклад источника ниже порога не считается; 0 — точный рендер
+}
+
+LIGHT_TILE = 16  # сторона экранного тайла для отсечения источников, пикс.
+PAIR_CHUNK = 1 << 16  # пар (точка, источник) за один проход освещения
+DENSE_FRACTION = 0.75  # если после отсечения осталось не меньше такой доли пар — считать без него
+DENSE_CHUNK = 1 << 14  # пар за проход плотного освещения: (источники × точки) держатся в кэше CPU
+
+
+def parse_lights(text):
+    lights = []
+    parts = text.replace(" ", "").split(';')
+    for part in parts:
+        if not part.strip():
+            continue
+        nums = re.findall(r'-?\d+\.?\d*', part)
+        if len(nums) == 4:
+            x, y, z, I0 = map(float, nums)
+            lights.append({"pos": np.array([x, y, z]), "I0": I0})
+    return lights
+
+
+def dot_rows(a, b):
+    # einsum заметно быстрее np.sum(a * b, axis=-1) на коротких векторах
+    return np.einsum("...k,...k->...", a, b)
+
+
+def norm_rows(v):
+    return np.sqrt(dot_rows(v, v))
+
+
+def normalize_rows(v):
+    """Нормирует векторы по последней оси; слишком короткие становятся нулевыми"""
+    n = norm_rows(v)[..., None]
+    ok = n > 1e-8
+    return np.where(ok, v / np.where(ok, n, 1.0), 0.0)
+
+
+# ==================== ЛУЧИ ====================
+
+def pixel_grid(Wres, Hres):
+    """Координаты центров пикселей экрана, мм: xs (Wres,), ys (Hres,)"""
+    pixel_size = max(W_mm / Wres, H_mm / Hres)
+    screen_w = pixel_size * Wres
+    screen_h = pixel_size * Hres
+    xs = -screen_w / 2 + (np.arange(Wres) + 0.5) * pixel_size
+    ys = screen_h / 2 - (np.arange(Hres) + 0.5) * pixel_size
+    return xs, ys
+
+
+def sphere_hits(xs, ys, z_obs):
+    """Пересекает все первичные лучи (ys × xs) со сферой одним проходом.
+
+    Возвращает индексы видимых пикселей в развёрнутой сетке, точки P, нормали N
+    и направления на наблюдателя V для них.
+    """
+    observer_pos = np.array([0.0, 0.0, z_obs])
+    # dir = (x, y, screen_z) - observer: dz одинаков для всех лучей,
+    # поэтому a и b собираются из одномерных xs и ys без полной сетки векторов
+    dz = screen_z - z_obs
+    oc = observer_pos - center
+    a = (xs * xs)[None, :] + (ys * ys)[:, None] + dz * dz
+    b = 2 * ((xs * oc[0])[None, :] + (ys * oc[1])[:, None] + dz * oc[2])
+    c = oc @ oc - R * R
+    disc = (b * b - 4 * a * c).ravel()
+    a, b = a.ravel(), b.ravel()
+
+    hit = disc >= 0
+    sqrt_d = np.sqrt(np.where(hit, disc, 0.0))
+    t = (-b - sqrt_d) / (2 * a)
+    t = np.where(t <= 0, (-b + sqrt_d) / (2 * a), t)
+    hit &= t > 0
+
+    idx = np.flatnonzero(hit)
+    row, col = np.divmod(idx, len(xs))
+    dirs = np.stack([xs[col], ys[row], np.full(len(idx), dz)], axis=1)
+    P = observer_pos + t[idx, None] * dirs
+    N = normalize_rows(P - center)
+    V = normalize_rows(observer_pos - P)
+    front = dot_rows(N, V) > 0
+    return idx[front], P[front], N[front], V[front]
+
+
+# ==================== ОСВЕЩЕНИЕ ====================
+
+def light_radii(light_I0, kd, ks, threshold):
+    """Радиусы влияния источников для порога яркости threshold.
+
+    Вклад источника не больше (kd + ks) * I0 / d², а если точка к нему задом
+    (N·L <= 0), остаётся только блик: не больше ks * I0 / d². Дальше r_front
+    (соответственно r_back) источник даёт меньше threshold. threshold <= 0 — без отсечения.
+    """
+    I0 = np.abs(light_I0)
+    if threshold <= 0:
+        inf = np.full(len(I0), np.inf)
+        return inf, inf
+    return np.sqrt(I0 * (kd + ks) / threshold), np.sqrt(I0 * ks / threshold)
+
+
+def cull_lights(tile, P, N, light_pos, r_front, r_back):
+    """Маска (тайлы, источники): источник нужен, если хоть в одной точке тайла может дать >= порога.
+
+    Тайл описывается сферой вокруг своих точек (центр, радиус) и конусом нормалей.
+    Для точки сферы P = center + R·N условие «источник сзади» (lp - P)·N <= 0
+    равносильно (lp - center)·N <= R, и его максимум по конусу считается аналитически.
+    """
+    n_tiles = tile.max() + 1
+    count = np.bincount(tile, minlength=n_tiles)[:, None]
+    tile_c = np.stack([np.bincount(tile, P[:, k], n_tiles) for k in range(3)], axis=1) / count
+    tile_r = np.zeros(n_tiles)
+    np.maximum.at(tile_r, tile, norm_rows(P - tile_c[tile]))
+
+    axis = normalize_rows(np.stack([np.bincount(tile, N[:, k], n_tiles) for k in range(3)], axis=1))
+    cos_spread = np.ones(n_tiles)
+    np.minimum.at(cos_spread, tile, dot_rows(N, axis[tile]))
+    spread = np.arccos(np.clip(cos_spread, -1.0, 1.0))
+
+    d_min = np.maximum(norm_rows(light_pos[None, :, :] - tile_c[:, None, :]) - tile_r[:, None], 0.0)
+
+    lc = light_pos - center
+    lc_len = norm_rows(lc)
+    cos_lc = np.clip(axis @ lc.T / np.where(lc_len > 0, lc_len, 1.0), -1.0, 1.0)
+    gap = np.maximum(np.arccos(cos_lc) - spread[:, None], 0.0)
+    behind = lc_len * np.cos(gap) <= R
+
+    return (d_min <= r_back) | (~behind & (d_min <= r_front))
+
+
+def shade_pairs(PNV, light_pos, light_I0, kd, ks, shininess):
+    """Блинн-Фонг для пар (точка, источник) в покомпонентной раскладке.
+
+    PNV — (9, n): строки x, y, z точки P, нормали N и направления V для каждой пары;
+    light_pos — (3, n), light_I0 — (n,): источник той же пары.
+    """
+    L = light_pos - PNV[0:3]
+    dist = np.sqrt(L[0] * L[0] + L[1] * L[1] + L[2] * L[2])
+    valid = dist >= 1e-6
+    dist = np.where(valid, dist, 1.0)
+    L /= dist
+
+    H = L + PNV[6:9]
+    h = np.sqrt(H[0] * H[0] + H[1] * H[1] + H[2] * H[2])
+    ok = h > 1e-8
+    H *= np.where(ok, 1.0 / np.where(ok, h, 1.0), 0.0)
+
+    N = PNV[3:6]
+    diff = kd * np.maximum(N[0] * L[0] + N[1] * L[1] + N[2] * L[2], 0)
+    spec = ks * (np.maximum(N[0] * H[0] + N[1] * H[1] + N[2] * H[2], 0) ** shininess)
+
+    bright = (diff + spec) * light_I0 / (dist * dist)
+    return np.where(valid, bright, 0.0)
+
+
+def shade_dense(P, N, V, light_pos, light_I0, kd, ks, shininess):
+    """Все источники для всех точек: оси (источники, точки), точки порциями по DENSE_CHUNK пар.
+
+    Та же модель, что shade_pairs, но без раскладки по парам и почти без временных
+    массивов: L нормируется на месте, H не нормируется — N·H делится на |H|.
+    """
+    lights_T = light_pos.T[:, :, None]
+    I0 = light_I0[:, None]
+    step = max(1, DENSE_CHUNK // len(light_I0))
+    brightness = np.empty(len(P))
+    for p0 in range(0, len(P), step):
+        p1 = min(p0 + step, len(P))
+        n, v = N[p0:p1].T, V[p0:p1].T[:, None, :]
+        L = lights_T - P[p0:p1].T[:, None, :]
+        dist = np.sqrt(L[0] * L[0] + L[1] * L[1] + L[2] * L[2])
+        valid = dist >= 1e-6
+        dist[~valid] = 1.0
+        L /= dist
+        diff = n[0] * L[0] + n[1] * L[1] + n[2] * L[2]
+
+        L += v  # L + V — ненормированный H
+        h = np.sqrt(L[0] * L[0] + L[1] * L[1] + L[2] * L[2])
+        ok = h > 1e-8
+        h[~ok] = 1.0
+        spec = n[0] * L[0] + n[1] * L[1] + n[2] * L[2]
+        spec /= h
+        spec[~ok] = 0.0
+
+        np.maximum(spec, 0, out=spec)
+        spec **= shininess
+        spec *= ks
+        np.maximum(diff, 0, out=diff)
+        diff *= kd
+        diff += spec
+        diff *= I0
+        diff /= dist * dist
+        diff[~valid] = 0.0
+        brightness[p0:p1] = diff.sum(axis=0)
+    return brightness
+
+
+def shade(P, N, V, tile, light_pos, light_I0, kd, ks, shininess, threshold=0.0, stats=None):
+    """Сумма по всем источникам для точек P; источники отсекаются по тайлам.
+
+    Для каждой точки берутся только источники, оставшиеся в её тайле, и пары
+    (точка, источник) считаются плоскими векторами порциями по PAIR_CHUNK.
+    Без порога (threshold <= 0) или если отсечение оставило не меньше DENSE_FRACTION
+    пар, раскладка по тайлам дороже экономии — тогда считается плотно (shade_dense).
+    В stats (если передан) накапливаются "dense" — точки × источники без отсечения
+    и "culled" — сколько пар реально посчитано.
+    """
+    dense = len(P) * len(light_I0)
+    if stats is not None:
+        stats["dense"] = stats.get("dense", 0) + dense
+    if threshold <= 0:
+        if stats is not None:
+            stats["culled"] = stats.get("culled", 0) + dense
+        return shade_dense(P, N, V, light_pos, light_I0, kd, ks, shininess)
+
+    tile = np.unique(tile, return_inverse=True)[1]
+    keep = cull_lights(tile, P, N, light_pos, *light_radii(light_I0, kd, ks, threshold))
+    # источники тайлов подряд: tile_lights[ptr[t]:ptr[t] + n_lit[t]]
+    tile_lights = np.nonzero(keep)[1]
+    n_lit = keep.sum(axis=1)
+    ptr = np.cumsum(n_lit) - n_lit
+
+    per_point = n_lit[tile]
+    pairs = int(per_point.sum())
+    if pairs >= DENSE_FRACTION * dense:
+        pairs = dense
+    if stats is not None:
+        stats["culled"] = stats.get("culled", 0) + pairs
+    if pairs == dense:
+        return shade_dense(P, N, V, light_pos, light_I0, kd, ks, shininess)
+
+    # у каждой точки её пары идут подряд, поэтому данные точек размножаются np.repeat
+    PNV = np.concatenate([P, N, V], axis=1).T.copy()
+    lights_T = light_pos.T.copy()
+    brightness = np.zeros(len(P))
+    ends = np.cumsum(per_point)
+    p0 = 0
+    while p0 < len(P):
+        # точки [p0, p1) дают не больше PAIR_CHUNK пар (но хотя бы одну точку)
+        base = ends[p0] - per_point[p0]
+        p1 = max(int(np.searchsorted(ends, base + PAIR_CHUNK, side="right")), p0 + 1)
+        counts = per_point[p0:p1]
+        point = np.repeat(np.arange(p0, p1), counts)
+        first = np.repeat(ends[p0:p1] - counts - base, counts)
+        lit = tile_lights[np.repeat(ptr[tile[p0:p1]], counts) + np.arange(len(point)) - first]
+        contrib = shade_pairs(np.repeat(PNV[:, p0:p1], counts, axis=1), lights_T[:, lit],
+                              light_I0[lit], kd, ks, shininess)
+        brightness[p0:p1] = np.bincount(point - p0, contrib, p1 - p0)
+        p0 = p1
+    return brightness
+
+
+def light_arrays(lights):
+    light_pos = np.array([light["pos"] for light in lights], dtype=np.float64).reshape(-1, 3)
+    light_I0 = np.array([light["I0"] for light in lights], dtype=np.float64)
+    return light_pos, light_I0
+
+
+def render_rows(xs, ys, z_obs, light_pos, light_I0, kd, ks, shininess, threshold=0.0, stats=None):
+    """Яркость (len(ys), len(xs)) для строк экрана с координатами ys"""
+    brightness = np.zeros(len(ys) * len(xs))
+    idx, P, N, V = sphere_hits(xs, ys, z_obs)
+    if len(idx) and len(light_I0):
+        row, col = np.divmod(idx, len(xs))
+        tiles_x = -(-len(xs) // LIGHT_TILE)
+        tile = row // LIGHT_TILE * tiles_x + col // LIGHT_TILE
+        brightness[idx] = shade(P, N, V, tile, light_pos, light_I0, kd, ks, shininess, threshold, stats)
+    return brightness.reshape(len(ys), len(xs))
+
+
+def render_brightness(Wres, Hres, z_obs, lights, kd, ks, shininess, threshold=0.0, stats=None):
+    """Яркость (Hres, Wres) для сферы, освещённой точечными источниками"""
+    xs, ys = pixel_grid(Wres, Hres)
+    return render_rows(xs, ys, z_obs, *light_arrays(lights), kd, ks, shininess, threshold, stats)
+
+
+def to_uint8(brightness):
+    max_b = brightness.max()
+    if max_b == 0:
+        max_b = 1.0
+    return (brightness / max_b * 255).clip(0, 255).astype(np.uint8)
+
+
+def normalize_params(params):
+    """Полный набор параметров с правильными типами; источники — список [x, y, z, I0]"""
+    p = dict(DEFAULT_PARAMS, **params)
+    lights = p["lights"]
+    if isinstance(lights, str):
+        lights = [[*light["pos"], light["I0"]] for light in parse_lights(lights)]
+    return {
+        "z": float(p["z"]),
+        "Wres": int(p["Wres"]),
+        "Hres": int(p["Hres"]),
+        "kd": float(p["kd"]),
+        "ks": float(p["ks"]),
+        "shininess": float(p["shininess"]),
+        "light_threshold": float(p["light_threshold"]),
+        "lights": [[float(v) for v in light] for light in lights],
+    }
+
+
+def _lights_from_params(p):
+    return [{"pos": np.array(light[:3]), "I0": light[3]} for light in p["lights"]]
+
+
+def render(params, stats=None):
+    """Яркость (Hres, Wres) по словарю параметров (см. DEFAULT_PARAMS); без GUI"""
+    p = normalize_params(params)
+    return render_brightness(p["Wres"], p["Hres"], p["z"], _lights_from_params(p),
+                             p["kd"], p["ks"], p["shininess"], p["light_threshold"], stats)
+
+
+def iter_bands(params, band_rows=8, stats=None):
+    """Тот же рендер полосами по band_rows строк: отдаёт (первая строка, яркость полосы).
+
+    Между полосами вызывающий может показать прогресс или бросить устаревший кадр.
+    """
+    p = normalize_params(params)
+    xs, ys = pixel_grid(p["Wres"], p["Hres"])
+    light_pos, light_I0 = light_arrays(_lights_from_params(p))
+    for r0 in range(0, len(ys), band_rows):
+        yield r0, render_rows(xs, ys[r0:r0 + band_rows], p["z"], light_pos, light_I0,
+                              p["kd"], p["ks"], p["shininess"], p["light_threshold"], stats)
+
+
+PROGRESSIVE_STEPS = (8, 4, 2, 1)
+
+
+def iter_progressive(params, steps=PROGRESSIVE_STEPS, stats=None, band_rows=8):
+    """Прогрессивный рендер: сначала каждый 8-й пиксель по обеим осям, потом 4-й, 2-й, все.
+
+    Уровень s считает настоящие пиксели полного разрешения на сетке с шагом s,
+    поэтому всё, что посчитано на грубом уровне, входит в итоговый кадр без пересчёта.
+    Строки уровня идут полосами по band_rows, как в iter_bands: после каждой полосы
+    отдаётся (s, None, пикселей посчитано с начала кадра), в конце уровня —
+    (s, превью (Hres, Wres) с NEAREST-растяжкой, пикселей посчитано с начала кадра).
+    Между полосами вызывающий может показать прогресс или бросить устаревший кадр.
+    """
+    p = normalize_params(params)
+    W, H = p["Wres"], p["Hres"]
+    xs, ys = pixel_grid(W, H)
+    light_pos, light_I0 = light_arrays(_lights_from_params(p))
+    args = (p["z"], light_pos, light_I0, p["kd"], p["ks"], p["shininess"], p["light_threshold"], stats)
+    brightness = np.zeros((H, W))
+    row_index = np.arange(H)
+
+    coarse = None
+    done = 0
+    for s in steps:
+        if coarse is None:
+            # первый уровень — вся сетка с шагом s
+            blocks = [(slice(0, H, s), slice(0, W, s))]
+        else:
+            # новые точки сетки s, которых нет на сетке coarse = 2s:
+            # нечётные строки целиком и чётные строки в нечётных столбцах
+            blocks = [(slice(s, H, coarse), slice(0, W, s)),
+                      (slice(0, H, coarse), slice(s, W, coarse))]
+        for rows, cols in blocks:
+            rows = row_index[rows]
+            for r0 in range(0, len(rows), band_rows):
+                band_idx = rows[r0:r0 + band_rows]
+                band = render_rows(xs[cols], ys[band_idx], *args)
+                brightness[band_idx, cols] = band
+                done += band.size
+                yield s, None, done
+        coarse = s
+
+        preview = brightness[::s, ::s].repeat(s, axis=0).repeat(s, axis=1)[:H, :W]
+        yield s, preview, done
@@ -0,0 +1,126 @@
+"""Перебор параметров рендера без GUI: сетки по Z, kd, ks, shininess и разрешению.
+
+Кадры считаются в параллельных процессах и кладутся в кэш, адресуемый содержимым
+(sha256 от параметров), поэтому повторный прогон пропускает уже посчитанные кадры.
+
+Пример:
+    python sweep.py --z 1000:6000:6 --kd 0.3,0.6 --res 150x100,300x200 --png frames
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from PIL import Image
+
+from renderer import DEFAULT_PARAMS, normalize_params, render, to_uint8
+
+# меняется вместе с формулами рендера — старые кадры в кэше перестают находиться
+RENDER_VERSION = 1
+CACHE_DIR = ".render_cache"
+
+
+def cache_key(params):
+    blob = json.dumps({"v": RENDER_VERSION, **normalize_params(params)}, sort_keys=True)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+def cache_path(cache_dir, key):
+    return os.path.join(cache_dir, key[:2], key + ".npy")
+
+
+def render_to_cache(params, path):
+    """Выполняется в процессе-воркере; запись атомарная, чтобы не оставить битый кадр"""
+    t0 = time.perf_counter()
+    brightness = render(params)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "wb") as f:
+        np.save(f, brightness)
+    os.replace(tmp, path)
+    return time.perf_counter() - t0
+
+
+def parse_grid(text, cast=float):
+    """'a,b,c' — список значений; 'start:stop:count' — равномерная сетка"""
+    if ":" in text:
+        start, stop, count = text.split(":")
+        return [cast(v) for v in np.linspace(float(start), float(stop), int(count))]
+    return [cast(v) for v in text.split(",") if v]
+
+
+def parse_res(text):
+    out = []
+    for item in text.split(","):
+        w, h = item.lower().split("x")
+        out.append((int(w), int(h)))
+    return out
+
+
+def frame_name(p):
+    # набор источников в имя целиком не влезает — короткий отпечаток, чтобы кадры с разными
+    # --lights не затирали друг друга
+    lights = hashlib.sha256(json.dumps(p["lights"], sort_keys=True).encode()).hexdigest()[:8]
+    return (f"z{p['z']:g}_kd{p['kd']:g}_ks{p['ks']:g}_sh{p['shininess']:g}"
+            f"_{p['Wres']}x{p['Hres']}_L{lights}.png")
+
+
+def sweep(grid, cache_dir=CACHE_DIR, png_dir=None, workers=None):
+    jobs = []
+    for z, kd, ks, sh, (w, h), lights in itertools.product(
+            grid["z"], grid["kd"], grid["ks"], grid["shininess"], grid["res"], grid["lights"]):
+        params = normalize_params({"z": z, "kd": kd, "ks": ks, "shininess": sh,
+                                   "Wres": w, "Hres": h, "lights": lights})
+        jobs.append((params, cache_path(cache_dir, cache_key(params))))
+
+    todo = [(p, path) for p, path in jobs if not os.path.exists(path)]
+    print(f"Кадров: {len(jobs)}, в кэше: {len(jobs) - len(todo)}, считать: {len(todo)}")
+
+    t0 = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(render_to_cache, p, path): p for p, path in todo}
+        for i, fut in enumerate(as_completed(futures), 1):
+            p = futures[fut]
+            print(f"  [{i}/{len(todo)}] {frame_name(p)}: {fut.result() * 1000:.0f} мс")
+    elapsed = time.perf_counter() - t0
+    if todo:
+        print(f"Посчитано {len(todo)} кадров за {elapsed:.2f} с ({len(todo) / elapsed:.1f} кадр/с)")
+
+    if png_dir:
+        os.makedirs(png_dir, exist_ok=True)
+        for p, path in jobs:
+            Image.fromarray(to_uint8(np.load(path)), mode="L").save(os.path.join(png_dir, frame_name(p)))
+    return [path for _, path in jobs]
+
+
+def main(argv=None):
+    d = DEFAULT_PARAMS
+    parser = argparse.ArgumentParser(description="Перебор параметров рендера ЛР4 без GUI")
+    parser.add_argument("--z", default=str(d["z"]), help="Z наблюдателя: список или start:stop:count")
+    parser.add_argument("--kd", default=str(d["kd"]))
+    parser.add_argument("--ks", default=str(d["ks"]))
+    parser.add_argument("--shininess", default=str(d["shininess"]))
+    parser.add_argument("--res", default=f"{d['Wres']}x{d['Hres']}", help="разрешения, например 150x100,300x200")
+    parser.add_argument("--lights", action="append", help="набор источников [x,y,z,I0];... (можно несколько)")
+    parser.add_argument("--cache", default=CACHE_DIR, help="папка кэша кадров")
+    parser.add_argument("--png", help="куда сложить PNG всех кадров сетки")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="число процессов")
+    args = parser.parse_args(argv)
+
+    grid = {
+        "z": parse_grid(args.z),
+        "kd": parse_grid(args.kd),
+        "ks": parse_grid(args.ks),
+        "shininess": parse_grid(args.shininess),
+        "res": parse_res(args.res),
+        "lights": args.lights or [d["lights"]],
+    }
+    sweep(grid, args.cache, args.png, args.workers)
+
+
+if __name__ == "__main__":
+    main()
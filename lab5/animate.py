@@ -0,0 +1,184 @@
+"""Рендер без окна: сцена и путь камеры из JSON/YAML -> пронумерованные PNG.
+
+Камера, как и в окне, всегда смотрит на центр сфер; путь задаёт только её положение:
+    "camera": {"orbit": {"radius": 3000, "height": 350, "frames": 120, "turns": 1}}
+    "camera": {"keyframes": [{"frame": 0, "pos": [448, 350, 3000]},
+                             {"frame": 60, "pos": [-2000, 800, 1500]}]}
+Между ключевыми кадрами положение интерполируется линейно. Сферы, источники
+и материал — см. scene_example.json.
+
+Ядро компилируется один раз до первого кадра, дальше на кадр грузятся только три
+координаты камеры. PNG кодируются в пуле потоков, пока считаются следующие кадры.
+В конце печатаются кадры в секунду и среднее время этапов: sync (загрузка в Taichi),
+kernel, readback (копия буфера кадра в PIL), encode (PNG, в потоках пула).
+
+Пример:
+    python animate.py scene_example.json frames --res 400x400 -j 4
+"""
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+import main as lr5
+
+DEFAULT_MATERIAL = {"kd": 0.5, "ks": 0.8, "shininess": 200.0, "shadows": True, "bvh": True}
+
+
+def load_scene(path):
+    """JSON или YAML (по расширению .yaml/.yml; нужен PyYAML)"""
+    with open(path, encoding="utf-8") as f:
+        if path.lower().endswith((".yaml", ".yml")):
+            try:
+                import yaml
+            except ImportError:
+                raise SystemExit("Для YAML-сцен нужен PyYAML: pip install pyyaml")
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def scene_spheres(scene):
+    return [{"pos": np.array(s["pos"], dtype=np.float32), "R": float(s["R"]),
+             "col": np.array(s.get("col", [1.0, 1.0, 1.0]), dtype=np.float32)} for s in scene["spheres"]]
+
+
+def scene_lights(scene):
+    """Строка в формате окна ("[x,y,z,I0];...") или список {"pos", "I0", "col"}"""
+    lights = scene.get("lights", [])
+    if isinstance(lights, str):
+        return lr5.parse_lights(lights)
+    return [{"pos": np.array(L["pos"], dtype=np.float32), "I0": float(L["I0"]),
+             "col": np.array(L.get("col", [1.0, 1.0, 1.0]), dtype=np.float32)} for L in lights]
+
+
+def camera_path(camera, spheres, frames=None):
+    """Положения камеры (n, 3) по описанию орбиты или ключевых кадров"""
+    if "orbit" in camera:
+        o = camera["orbit"]
+        n = frames or int(o.get("frames", 120))
+        center = np.mean([s["pos"] for s in spheres], axis=0) if spheres else np.zeros(3)
+        center = np.array(o.get("center", center), dtype=np.float64)
+        angle = math.radians(o.get("start_deg", 0.0)) + 2 * math.pi * o.get("turns", 1.0) * np.arange(n) / n
+        # орбита в плоскости XZ вокруг центра, на высоте height над ним; угол 0 — камера на +Z
+        return np.stack([center[0] + o["radius"] * np.sin(angle),
+                         np.full(n, center[1] + o.get("height", 0.0)),
+                         center[2] + o["radius"] * np.cos(angle)], axis=1)
+
+    keys = sorted(camera["keyframes"], key=lambda k: k["frame"])
+    at = np.array([k["frame"] for k in keys], dtype=np.float64)
+    pos = np.array([k["pos"] for k in keys], dtype=np.float64)
+    n = frames or int(at[-1]) + 1
+    t = np.arange(n, dtype=np.float64)
+    return np.stack([np.interp(t, at, pos[:, a]) for a in range(3)], axis=1)
+
+
+class StageTimer:
+    """Суммарное время и число замеров по этапам; add вызывается и из потоков пула"""
+
+    def __init__(self):
+        self.total = {}
+        self.count = {}
+        self.lock = threading.Lock()
+
+    def add(self, stage, seconds):
+        with self.lock:
+            self.total[stage] = self.total.get(stage, 0.0) + seconds
+            self.count[stage] = self.count.get(stage, 0) + 1
+
+    def summary(self):
+        return ", ".join(f"{stage} {self.total[stage] / self.count[stage] * 1000:.1f} мс"
+                         for stage in self.total)
+
+
+def render_sequence(scene, out_dir, Wres, Hres, frames=None, workers=4, prefix="frame"):
+    spheres = scene_spheres(scene)
+    material = dict(DEFAULT_MATERIAL, **scene.get("material", {}))
+    path = camera_path(scene["camera"], spheres, frames)
+    os.makedirs(out_dir, exist_ok=True)
+
+    buf = lr5.SceneBuffer()
+    buf.set_spheres(spheres)
+    buf.set_lights(scene_lights(scene)[:lr5.MAX_LIGHTS])
+    buf.set_material(material["kd"], material["ks"], material["shininess"], material["shadows"], material["bvh"])
+    buf.set_camera(*path[0])
+    buf.upload()
+
+    out = lr5.render_target(Wres, Hres)
+    mask = np.zeros((1, 1), dtype=np.uint8)  # камера движется каждый кадр — маска теней не нужна
+
+    def kernel():
+        lr5.render_kernel(Wres, Hres, float(Wres), float(Hres), float(lr5.SCREEN_Z), 1, 0,
+                          out, lr5.SHADOW_TRACE, mask)
+        lr5.ti.sync()
+
+    t0 = time.perf_counter()
+    kernel()  # компиляция ядра — до отсчёта кадров
+    print(f"Компиляция и первый кадр: {time.perf_counter() - t0:.2f} с; кадров {len(path)}, {Wres}x{Hres}")
+
+    timer = StageTimer()
+    digits = max(4, len(str(len(path) - 1)))
+
+    def encode(pil, fn):
+        t = time.perf_counter()
+        pil.save(fn)
+        timer.add("encode", time.perf_counter() - t)
+
+    pending = deque()
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for k, cam in enumerate(path):
+            t = time.perf_counter()
+            buf.set_camera(*cam)
+            buf.upload()
+            t, t_prev = time.perf_counter(), t
+            timer.add("sync", t - t_prev)
+
+            kernel()
+            t, t_prev = time.perf_counter(), t
+            timer.add("kernel", t - t_prev)
+
+            pil = Image.fromarray(out, mode='RGB')  # копия: буфер кадра нужен следующему кадру
+            timer.add("readback", time.perf_counter() - t)
+
+            pending.append(pool.submit(encode, pil, os.path.join(out_dir, f"{prefix}_{k:0{digits}d}.png")))
+            # не больше двух кадров на поток в очереди — память не растёт, если PNG не успевают
+            while len(pending) > 2 * workers:
+                pending.popleft().result()
+        for fut in pending:
+            fut.result()
+    elapsed = time.perf_counter() - t_start
+
+    print(f"{len(path)} кадров за {elapsed:.2f} с: {len(path) / elapsed:.1f} кадр/с")
+    print(f"  в среднем на кадр: {timer.summary()}")
+    return elapsed
+
+
+def parse_res(text):
+    w, h = text.lower().split("x")
+    return int(w), int(h)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Рендер сцены ЛР5 по пути камеры в PNG без окна")
+    parser.add_argument("scene", help="сцена .json или .yaml")
+    parser.add_argument("out", help="папка для кадров")
+    parser.add_argument("--res", help="разрешение, например 800x800 (по умолчанию из сцены)")
+    parser.add_argument("--frames", type=int, help="число кадров (по умолчанию из пути камеры)")
+    parser.add_argument("--prefix", default="frame", help="имя файлов: <prefix>_0000.png")
+    parser.add_argument("-j", "--workers", type=int, default=4, help="потоков кодирования PNG")
+    args = parser.parse_args(argv)
+
+    scene = load_scene(args.scene)
+    Wres, Hres = parse_res(args.res) if args.res else tuple(scene.get("resolution", (800, 800)))
+    render_sequence(scene, args.out, Wres, Hres, args.frames, args.workers, args.prefix)
+
+
+if __name__ == "__main__":
+    main()
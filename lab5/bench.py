@@ -0,0 +1,138 @@
+"""Время кадра: перебор всех сфер против обхода BVH при 8, 32, 512 и 8192 сферах.
+Вторая таблица — повторный кадр после смены только материала (kd, ks, shininess):
+тени трассируются заново или берутся из маски теней прошлого кадра.
+Третья — накладные расходы на кадр 800x800 вне ядра: прежний путь (новый float32-массив,
+np.clip и astype, PIL, PNG на каждый кадр) против буфера uint8, который заполняет ядро.
+
+Сферы случайно расставлены в кубе со стороной 800 мм около (0, 0, 1000), радиус
+уменьшается с ростом числа сфер, чтобы они заполняли кадр примерно одинаково.
+Тени включены: на каждый пиксель приходятся первичный луч и лучи теней к двум источникам.
+
+Запуск: python bench.py [--res 400x400] [--counts 8,32,512,8192]
+"""
+import argparse
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+import main as lr5
+
+LIGHTS = "[-300,-300,1000,1700, 150, 150, 0];[300,-300,1000,1000, 0, 100, 100];"
+CAMERA = (448.0, 350.0, 3000.0)
+COUNTS = (8, 32, 512, 8192)
+
+
+def random_spheres(n, seed=1):
+    rng = np.random.default_rng(seed)
+    pos = rng.uniform(-400, 400, (n, 3)) + [0.0, 0.0, 1000.0]
+    rad = rng.uniform(0.3, 1.0, n) * 250.0 / n ** (1 / 3)
+    col = rng.uniform(0.2, 1.0, (n, 3))
+    return pos, rad, col
+
+
+def setup_scene(n):
+    lights = lr5.parse_lights(LIGHTS)
+    lr5.light_active[None] = len(lights)
+    for i, L in enumerate(lights):
+        lr5.light_pos[i] = L["pos"].tolist()
+        lr5.light_I0[i] = L["I0"]
+        lr5.light_col[i] = L["col"].tolist()
+    lr5.kd_field[None], lr5.ks_field[None], lr5.shininess_field[None] = 0.5, 0.8, 200.0
+    lr5.shadows_field[None] = 1
+    lr5.cam_x_field[None], lr5.cam_y_field[None], lr5.cam_z_field[None] = CAMERA
+
+    t0 = time.perf_counter()
+    nodes = lr5.upload_spheres(*random_spheres(n))
+    return nodes, time.perf_counter() - t0
+
+
+def frame(Wres, Hres, use_bvh, repeats, mode=lr5.SHADOW_TRACE, mask=None):
+    """Лучшее время кадра из repeats (после прогревочного запуска с компиляцией ядра)"""
+    lr5.bvh_field[None] = 1 if use_bvh else 0
+    out = np.zeros((Hres, Wres, 3), dtype=np.uint8)
+    if mask is None:
+        mask = np.zeros((1, 1), dtype=np.uint8)
+    args = (Wres, Hres, float(Wres), float(Hres), float(lr5.SCREEN_Z), 1, 0, out, mode, mask)
+    lr5.render_kernel(*args)
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        lr5.render_kernel(*args)
+        lr5.ti.sync()
+        best = min(best, time.perf_counter() - t0)
+    return out, best
+
+
+def timed(fn, repeats=10):
+    best = float("inf")
+    for _ in range(repeats):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+def host_overhead(Wres=800, Hres=800):
+    setup_scene(2)
+    lr5.bvh_field[None] = 1
+    mask = np.zeros((1, 1), dtype=np.uint8)
+    out = lr5.render_target(Wres, Hres)
+    t_kernel = timed(lambda: (lr5.render_kernel(Wres, Hres, float(Wres), float(Hres), float(lr5.SCREEN_Z), 1, 0,
+                                                out, lr5.SHADOW_TRACE, mask), lr5.ti.sync()))
+    t_new = timed(lambda: lr5.render_scene_to_image(Wres, Hres)) - t_kernel
+
+    frame_f32 = out.astype(np.float32) / 255.0
+
+    def old_host_path():
+        # прежний render_scene_to_image и finish_render без ядра
+        out_np = np.zeros((Hres, Wres, 3), dtype=np.float32)  # сюда писало ядро
+        out_np.max()  # неиспользуемый maxv
+        img8 = np.clip(frame_f32 * 255.0, 0, 255).astype(np.uint8)
+        Image.fromarray(img8, mode='RGB').save(io.BytesIO(), format="PNG")
+
+    t_old = timed(old_host_path)
+    print(f"\nВне ядра на кадр {Wres}x{Hres} (ядро {t_kernel * 1000:.1f} мс): "
+          f"было {t_old * 1000:.1f} мс, стало {t_new * 1000:.1f} мс")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перебор сфер против BVH в ядре ЛР5")
+    parser.add_argument("--res", default="400x400")
+    parser.add_argument("--counts", default=",".join(map(str, COUNTS)))
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(argv)
+    Wres, Hres = map(int, args.res.lower().split("x"))
+    setup_scene(1)  # первый from_numpy компилирует копирующие ядра — не в счёт построения
+
+    print(f"Кадр {Wres}x{Hres}, тени от 2 источников")
+    print(f"{'сфер':>6} {'узлов':>6} {'сборка, мс':>11} {'перебор, мс':>12} {'BVH-кадр, мс':>13} "
+          f"{'ускорение':>10} {'макс. разн.':>12}")
+    for n in map(int, args.counts.split(",")):
+        nodes, t_build = setup_scene(n)
+        # перебор при тысячах сфер идёт секунды — его хватит одного замера
+        slow_repeats = 1 if n > 1000 else args.repeats
+        ref, t_lin = frame(Wres, Hres, False, slow_repeats)
+        ref = ref.astype(int)
+        out, t_bvh = frame(Wres, Hres, True, args.repeats)
+        print(f"{n:>6} {nodes:>6} {t_build * 1000:>11.1f} {t_lin * 1000:>12.1f} {t_bvh * 1000:>13.1f} "
+              f"{t_lin / t_bvh:>9.1f}x {np.abs(out.astype(int) - ref).max():>12}")
+
+    print("\nСмена только kd/ks/shininess (BVH): тени заново против маски теней")
+    print(f"{'сфер':>6} {'тени, мс':>9} {'маска, мс':>10} {'ускорение':>10} {'макс. разн.':>12}")
+    for n in map(int, args.counts.split(",")):
+        setup_scene(n)
+        mask = np.zeros((Hres, Wres), dtype=np.uint8)
+        frame(Wres, Hres, True, 1, lr5.SHADOW_STORE, mask)  # кадр, заполняющий маску
+        lr5.kd_field[None], lr5.ks_field[None], lr5.shininess_field[None] = 0.7, 0.4, 50.0
+        ref, t_trace = frame(Wres, Hres, True, args.repeats)
+        ref = ref.astype(int)
+        out, t_mask = frame(Wres, Hres, True, args.repeats, lr5.SHADOW_REUSE, mask)
+        print(f"{n:>6} {t_trace * 1000:>9.1f} {t_mask * 1000:>10.1f} {t_trace / t_mask:>9.1f}x "
+              f"{np.abs(out.astype(int) - ref).max():>12}")
+    host_overhead()
+
+
+if __name__ == "__main__":
+    main()
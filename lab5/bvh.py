@@ -0,0 +1,57 @@
+"""BVH (иерархия ограничивающих параллелепипедов) над сферами, строится на CPU.
+
+Дерево хранится плоско, в порядке обхода в глубину: левый потомок узла i — всегда i + 1,
+правый — node_a[i]. У листа node_n[i] > 0 сфер: их индексы лежат подряд с позиции node_a[i]
+в перестановке order, поэтому в ядре лист — отрезок одного массива индексов.
+"""
+import numpy as np
+
+LEAF_SIZE = 4  # сфер в листе, меньше — глубже дерево
+MAX_DEPTH = 64  # размер стека обхода в ядре; медианное деление даёт глубину ~log2(N / LEAF_SIZE)
+
+
+def build_bvh(pos, rad, leaf_size=LEAF_SIZE):
+    """pos (N, 3), rad (N,) -> (order, node_min, node_max, node_a, node_n).
+
+    Деление по медиане центров вдоль самой длинной оси их разброса: дерево сбалансировано,
+    построение O(N log N) и не зависит от того, насколько «плохо» расставлены сферы.
+    """
+    pos = np.asarray(pos, dtype=np.float64).reshape(-1, 3)
+    rad = np.asarray(rad, dtype=np.float64).reshape(-1)
+    n = len(pos)
+    # запас на округление float32 в ядре: иначе луч по касательной к сфере мог бы пройти мимо коробки
+    pad = rad[:, None] * (1 + 1e-5) + 1e-3
+    lo_s, hi_s = pos - pad, pos + pad
+
+    order = np.arange(n)
+    cap = max(1, 2 * n)
+    node_min = np.zeros((cap, 3))
+    node_max = np.zeros((cap, 3))
+    node_a = np.zeros(cap, dtype=np.int32)
+    node_n = np.zeros(cap, dtype=np.int32)
+    if n == 0:
+        return order, node_min[:1], node_max[:1], node_a[:1], node_n[:1]
+
+    count = 0
+    stack = [(0, n, -1)]  # (начало, конец в order, родитель, ждущий индекс правого потомка)
+    while stack:
+        start, end, parent = stack.pop()
+        # номера раздаются в порядке снятия со стека: левый потомок снимается сразу за родителем
+        node = count
+        count += 1
+        if parent >= 0:
+            node_a[parent] = node
+        idx = order[start:end]
+        node_min[node] = lo_s[idx].min(axis=0)
+        node_max[node] = hi_s[idx].max(axis=0)
+        if end - start <= leaf_size:
+            node_a[node], node_n[node] = start, end - start
+            continue
+
+        c = pos[idx]
+        axis = int(np.argmax(c.max(axis=0) - c.min(axis=0)))
+        mid = (end - start) // 2
+        order[start:end] = idx[np.argpartition(c[:, axis], mid)]
+        stack.append((start + mid, end, node))
+        stack.append((start, start + mid, -1))
+    return order, node_min[:count], node_max[:count], node_a[:count], node_n[:count]
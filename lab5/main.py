@@ -1,15 +1,20 @@
+import queue
 import re
 import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
 from tkinter import ttk, messagebox
 
 import numpy as np
 import taichi as ti
 from PIL import Image, ImageTk
 
+from bvh import MAX_DEPTH, build_bvh
+
 ti.init(arch=ti.cpu)
 
-MAX_SPHERES = 32
+MAX_SPHERES = 16384
 MAX_LIGHTS = 8
+MAX_NODES = 2 * MAX_SPHERES  # медианное деление даёт не больше 2N - 1 узлов
 
 SCREEN_Z = 0.0
 W_MM = 800
@@ -20,6 +25,14 @@ sphere_rad = ti.field(dtype=ti.f32, shape=MAX_SPHERES)
 sphere_col = ti.Vector.field(3, dtype=ti.f32, shape=MAX_SPHERES)
 sphere_active = ti.field(dtype=ti.i32, shape=())  # count
 
+# BVH над сферами (см. bvh.py); сферы листа — отрезок bvh_prim
+bvh_min = ti.Vector.field(3, dtype=ti.f32, shape=MAX_NODES)
+bvh_max = ti.Vector.field(3, dtype=ti.f32, shape=MAX_NODES)
+bvh_a = ti.field(dtype=ti.i32, shape=MAX_NODES)  # правый потомок или начало листа в bvh_prim
+bvh_prim = ti.field(dtype=ti.i32, shape=MAX_SPHERES)  # индексы сфер в порядке листьев
+bvh_n = ti.field(dtype=ti.i32, shape=MAX_NODES)  # сфер в листе, 0 — внутренний узел
+bvh_field = ti.field(dtype=ti.i32, shape=())  # 0 — перебор всех сфер, 1 — обход BVH
+
 light_pos = ti.Vector.field(3, dtype=ti.f32, shape=MAX_LIGHTS)
 light_I0 = ti.field(dtype=ti.f32, shape=MAX_LIGHTS)
 light_col = ti.Vector.field(3, dtype=ti.f32, shape=MAX_LIGHTS)
@@ -34,6 +47,7 @@ cam_x_field = ti.field(dtype=ti.f32, shape=())
 cam_y_field = ti.field(dtype=ti.f32, shape=())
 cam_z_field = ti.field(dtype=ti.f32, shape=())
 
+# буфер кадра (IMG_H, IMG_W, 3) uint8: ядро пишет в него напрямую, на CPU без копирования
 img_field = None
 IMG_W = 0
 IMG_H = 0
@@ -63,6 +77,109 @@ def clamp(n, a, b):
     return max(a, min(b, n))
 
 
+def upload_spheres(pos, rad, col):
+    """Строит BVH по сферам и загружает сферы и узлы дерева в поля Taichi.
+
+    pos (N, 3), rad (N,), col (N, 3); N <= MAX_SPHERES. Возвращает число узлов дерева.
+    """
+    n = len(rad)
+    order, node_min, node_max, node_a, node_n = build_bvh(pos, rad)
+
+    def padded(a, size):
+        out = np.zeros((size,) + a.shape[1:], dtype=np.float32 if a.dtype.kind == 'f' else np.int32)
+        out[:len(a)] = a
+        return out
+
+    # сферы остаются в исходном порядке: от него зависят центр сцены и перебор без BVH
+    sphere_pos.from_numpy(padded(np.asarray(pos, dtype=np.float32).reshape(-1, 3), MAX_SPHERES))
+    sphere_rad.from_numpy(padded(np.asarray(rad, dtype=np.float32), MAX_SPHERES))
+    sphere_col.from_numpy(padded(np.asarray(col, dtype=np.float32).reshape(-1, 3), MAX_SPHERES))
+    sphere_active[None] = n
+
+    bvh_prim.from_numpy(padded(order, MAX_SPHERES))
+
+    bvh_min.from_numpy(padded(node_min, MAX_NODES))
+    bvh_max.from_numpy(padded(node_max, MAX_NODES))
+    bvh_a.from_numpy(padded(node_a, MAX_NODES))
+    bvh_n.from_numpy(padded(node_n, MAX_NODES))
+    shadow_cache.invalidate()
+    return len(node_n)
+
+
+class SceneBuffer:
+    """Сцена на стороне CPU: структура массивов в формате полей Taichi и флаги изменений.
+
+    Группы полей — сферы, источники, материал (kd, ks, shininess, тени, BVH) и камера —
+    загружаются в Taichi только если изменились с прошлой загрузки: сферы и источники
+    одним from_numpy на поле, скаляры — по одному. При перетаскивании камеры грузятся
+    только три её координаты, а BVH перестраивается лишь при изменении сфер.
+    """
+
+    def __init__(self):
+        self.sphere_pos = np.zeros((0, 3), dtype=np.float32)
+        self.sphere_rad = np.zeros(0, dtype=np.float32)
+        self.sphere_col = np.zeros((0, 3), dtype=np.float32)
+        self.light_pos = np.zeros((MAX_LIGHTS, 3), dtype=np.float32)
+        self.light_I0 = np.zeros(MAX_LIGHTS, dtype=np.float32)
+        self.light_col = np.zeros((MAX_LIGHTS, 3), dtype=np.float32)
+        self.n_lights = 0
+        self.material = np.zeros(5, dtype=np.float32)  # kd, ks, shininess, тени 0/1, BVH 0/1
+        self.camera = np.zeros(3, dtype=np.float32)
+        self.dirty = {"spheres", "lights", "material", "camera"}
+
+    def set_spheres(self, spheres):
+        spheres = spheres[:MAX_SPHERES]
+        self.sphere_pos = np.array([s["pos"] for s in spheres], dtype=np.float32).reshape(-1, 3)
+        self.sphere_rad = np.array([s["R"] for s in spheres], dtype=np.float32)
+        self.sphere_col = np.array([s["col"] for s in spheres], dtype=np.float32).reshape(-1, 3)
+        self.dirty.add("spheres")
+
+    def set_lights(self, lights):
+        lights = lights[:MAX_LIGHTS]
+        pos = np.zeros_like(self.light_pos)
+        I0 = np.zeros_like(self.light_I0)
+        col = np.zeros_like(self.light_col)
+        for i, L in enumerate(lights):
+            pos[i], I0[i], col[i] = L["pos"], L["I0"], L["col"]
+        if (len(lights) != self.n_lights or not np.array_equal(pos, self.light_pos)
+                or not np.array_equal(I0, self.light_I0) or not np.array_equal(col, self.light_col)):
+            self.light_pos, self.light_I0, self.light_col, self.n_lights = pos, I0, col, len(lights)
+            self.dirty.add("lights")
+
+    def set_material(self, kd, ks, shininess, shadows, use_bvh):
+        self._set("material", [kd, ks, shininess, 1 if shadows else 0, 1 if use_bvh else 0])
+
+    def set_camera(self, x, y, z):
+        self._set("camera", [x, y, z])
+
+    def _set(self, group, values):
+        values = np.array(values, dtype=np.float32)
+        if not np.array_equal(values, getattr(self, group)):
+            setattr(self, group, values)
+            self.dirty.add(group)
+
+    def upload(self):
+        """Загружает в Taichi изменившиеся группы; возвращает их имена"""
+        dirty, self.dirty = self.dirty, set()
+        if "spheres" in dirty:
+            upload_spheres(self.sphere_pos, self.sphere_rad, self.sphere_col)
+        if "lights" in dirty:
+            light_pos.from_numpy(self.light_pos)
+            light_I0.from_numpy(self.light_I0)
+            light_col.from_numpy(self.light_col)
+            light_active[None] = self.n_lights
+        if "material" in dirty:
+            kd, ks, shininess, shadows, use_bvh = self.material
+            kd_field[None] = kd
+            ks_field[None] = ks
+            shininess_field[None] = shininess
+            shadows_field[None] = int(shadows)
+            bvh_field[None] = int(use_bvh)
+        if "camera" in dirty:
+            cam_x_field[None], cam_y_field[None], cam_z_field[None] = self.camera
+        return dirty
+
+
 @ti.func
 def normalize(v):
     n = ti.sqrt(v.dot(v))
@@ -76,16 +193,19 @@ def intersect_sphere(ray_o, ray_d, idx):
 
     oc = ray_o - C
     a = ray_d.dot(ray_d)
-    b = 2.0 * ray_d.dot(oc)
-    c = oc.dot(oc) - R * R
-    disc = b * b - 4 * a * c
+    b = ray_d.dot(oc)
+    # дискриминант через расстояние от центра до прямой луча: b² - a·c = a·(R² - |h|²).
+    # В виде b² - 4ac он теряет точность во float32, когда сфера мала по сравнению
+    # с расстоянием до неё, и касательные лучи попадают или промахиваются случайно
+    h = oc - (b / a) * ray_d
+    disc = a * (R * R - h.dot(h))
 
     t = -1.0  # default (no hit)
 
     if disc >= 0.0:
         sqrt_d = ti.sqrt(disc)
-        t1 = (-b - sqrt_d) / (2.0 * a)
-        t2 = (-b + sqrt_d) / (2.0 * a)
+        t1 = (-b - sqrt_d) / a
+        t2 = (-b + sqrt_d) / a
 
         best = 1e9
         if t1 > 1e-6 and t1 < best:
@@ -99,8 +219,137 @@ def intersect_sphere(ray_o, ray_d, idx):
     return t
 
 
+@ti.func
+def hit_box(ro, inv_d, bmin, bmax, t_max):
+    # слэб-тест: отрезок [tn, tf] пересечения луча с параллелепипедом должен лежать в (0, t_max)
+    t0 = (bmin - ro) * inv_d
+    t1 = (bmax - ro) * inv_d
+    tn = ti.min(t0, t1).max()
+    tf = ti.max(t0, t1).min()
+    return tn <= tf and tf > 0.0 and tn < t_max
+
+
+@ti.func
+def trace(ro, rd, t_max, skip):
+    """Ближайшая сфера на луче с 0 < t < t_max, кроме skip: (t, индекс) или (t_max, -1).
+
+    С bvh_field = 1 обходится дерево: стек узлов, ближний потомок снимается первым,
+    узлы, чей параллелепипед дальше уже найденного пересечения, отбрасываются.
+    """
+    best_t = t_max
+    best = -1
+    num_spheres = sphere_active[None]
+    if bvh_field[None] == 0:
+        for s in range(num_spheres):
+            if s != skip:
+                t = intersect_sphere(ro, rd, s)
+                if t > 0.0 and t < best_t:
+                    best_t = t
+                    best = s
+    elif num_spheres > 0:
+        inv_d = ti.Vector([0.0, 0.0, 0.0])
+        for k in ti.static(range(3)):
+            inv_d[k] = 1.0 / rd[k] if abs(rd[k]) > 1e-12 else 1e12
+        stack = ti.Vector.zero(ti.i32, MAX_DEPTH)
+        sp = 1
+        while sp > 0:
+            sp -= 1
+            node = stack[sp]
+            if hit_box(ro, inv_d, bvh_min[node], bvh_max[node], best_t):
+                count = bvh_n[node]
+                if count > 0:
+                    first = bvh_a[node]
+                    for k in range(first, first + count):
+                        s = bvh_prim[k]
+                        if s != skip:
+                            t = intersect_sphere(ro, rd, s)
+                            if t > 0.0 and t < best_t:
+                                best_t = t
+                                best = s
+                else:
+                    near = node + 1
+                    far = bvh_a[node]
+                    # ближе тот потомок, чей центр раньше по лучу: он снимается со стека первым
+                    if (bvh_min[far] + bvh_max[far] - bvh_min[near] - bvh_max[near]).dot(rd) < 0.0:
+                        near, far = far, near
+                    stack[sp] = far
+                    stack[sp + 1] = near
+                    sp += 2
+    return best_t, best
+
+
+@ti.func
+def blocks(o, d, t_max, s):
+    """Пересекает ли сфера s отрезок луча (0, t_max); d — единичный.
+
+    Сначала дешёвые отказы без корня: сфера целиком позади начала луча или за источником
+    (проекция центра на луч ± R вне отрезка), центр дальше R от прямой луча.
+    """
+    oc = sphere_pos[s] - o
+    R = sphere_rad[s]
+    tc = oc.dot(d)
+    hit = False
+    if tc + R > 0.0 and tc - R < t_max:
+        h = oc - tc * d
+        if h.dot(h) <= R * R:
+            t = intersect_sphere(o, d, s)
+            hit = t > 0.0 and t < t_max
+    return hit
+
+
+@ti.func
+def occluded(o, d, t_max, skip):
+    """Есть ли хоть одна сфера (кроме skip) между o и источником на расстоянии t_max.
+
+    Любое пересечение годится, поэтому обход заканчивается на первом. В BVH узлы
+    отбрасываются слэб-тестом по отрезку (0, t_max): всё, что за источником, не смотрится.
+    """
+    hit = False
+    num_spheres = sphere_active[None]
+    if bvh_field[None] == 0:
+        for s in range(num_spheres):
+            if s != skip and blocks(o, d, t_max, s):
+                hit = True
+                break
+    elif num_spheres > 0:
+        inv_d = ti.Vector([0.0, 0.0, 0.0])
+        for k in ti.static(range(3)):
+            inv_d[k] = 1.0 / d[k] if abs(d[k]) > 1e-12 else 1e12
+        stack = ti.Vector.zero(ti.i32, MAX_DEPTH)
+        sp = 1
+        while sp > 0 and not hit:
+            sp -= 1
+            node = stack[sp]
+            if hit_box(o, inv_d, bvh_min[node], bvh_max[node], t_max):
+                count = bvh_n[node]
+                if count > 0:
+                    first = bvh_a[node]
+                    for k in range(first, first + count):
+                        s = bvh_prim[k]
+                        if s != skip and blocks(o, d, t_max, s):
+                            hit = True
+                            break
+                else:
+                    stack[sp] = bvh_a[node]
+                    stack[sp + 1] = node + 1
+                    sp += 2
+    return hit
+
+
+# режимы маски теней в render_kernel: бит Lidx маски пикселя — пиксель в тени от источника Lidx
+SHADOW_TRACE = 0  # трассировать тени, маску не трогать
+SHADOW_STORE = 1  # трассировать и записать маску
+SHADOW_REUSE = 2  # взять тени из маски (геометрия, источники и камера те же)
+
+
 @ti.kernel
-def render_kernel(width: int, height: int, w_mm: ti.f32, h_mm: ti.f32, screen_z: ti.f32, out: ti.types.ndarray()):
+def render_kernel(width: int, height: int, w_mm: ti.f32, h_mm: ti.f32, screen_z: ti.f32,
+                  step: int, coarse: int, out: ti.types.ndarray(),
+                  shadow_mode: int, mask: ti.types.ndarray()):
+    # Считаются пиксели на сетке с шагом step, кроме тех, что уже посчитаны на сетке coarse
+    # (coarse = 0 — ничего не пропускать). step = 1, coarse = 0 — обычный полный кадр.
+    # out (height, width, 3) uint8 — готовые цвета кадра.
+    # mask (height, width) uint8 — маска теней, см. SHADOW_*; при SHADOW_TRACE не читается.
     kd = kd_field[None]
     ks = ks_field[None]
     shininess = shininess_field[None]
@@ -134,104 +383,177 @@ def render_kernel(width: int, height: int, w_mm: ti.f32, h_mm: ti.f32, screen_z:
     half_w = w_mm / 2.0
     half_h = h_mm / 2.0
 
-    for j in range(height):
-        for i in range(width):
-            u = (i + 0.5) / width - 0.5
-            v = 0.5 - (j + 0.5) / height
-
-            # Рассчитываем точку на виртуальном экране
-            screen_point = u * 2.0 * half_w * right + v * 2.0 * half_h * up
-            # Луч идет от камеры через точку на экране
-            dir_norm = normalize(forward * focal_length + screen_point)
-
-            nearest_t = 1e9
-            nearest_idx = -1
-            for s in range(num_spheres):
-                t = intersect_sphere(cam, dir_norm, s)
-                if t > 0.0 and t < nearest_t:
-                    nearest_t = t
-                    nearest_idx = s
-
-            if nearest_idx == -1:
-                out[j, i, 0] = 0.0
-                out[j, i, 1] = 0.0
-                out[j, i, 2] = 0.0
-                continue
+    for jj, ii in ti.ndrange((height + step - 1) // step, (width + step - 1) // step):
+        j = jj * step
+        i = ii * step
+        if coarse > 0 and j % coarse == 0 and i % coarse == 0:
+            continue
 
-            P = cam + nearest_t * dir_norm
-            C = sphere_pos[nearest_idx]
-            N = normalize(P - C)
-            V = normalize(cam - P)
-            if N.dot(V) <= 0.0:
-                out[j, i, 0] = 0.0
-                out[j, i, 1] = 0.0
-                out[j, i, 2] = 0.0
-                continue
+        u = (i + 0.5) / width - 0.5
+        v = 0.5 - (j + 0.5) / height
 
-            surf_col = sphere_col[nearest_idx]
-            ambient = 0.05 * surf_col
-            cr, cg, cb = ambient[0], ambient[1], ambient[2]
+        # Рассчитываем точку на виртуальном экране
+        screen_point = u * 2.0 * half_w * right + v * 2.0 * half_h * up
+        # Луч идет от камеры через точку на экране
+        dir_norm = normalize(forward * focal_length + screen_point)
 
-            for Lidx in range(num_lights):
-                Lpos = light_pos[Lidx]
-                Lvec = Lpos - P
-                dist = Lvec.norm()
-                if dist < 1e-6:
-                    continue
-                L = Lvec / dist
+        nearest_t, nearest_idx = trace(cam, dir_norm, 1e9, -1)
 
-                dot_nl = N.dot(L)
-                if dot_nl <= 0.0:
-                    continue
+        if nearest_idx == -1:
+            out[j, i, 0] = ti.u8(0)
+            out[j, i, 1] = ti.u8(0)
+            out[j, i, 2] = ti.u8(0)
+            continue
 
-                H = normalize(L + V)
+        P = cam + nearest_t * dir_norm
+        C = sphere_pos[nearest_idx]
+        N = normalize(P - C)
+        V = normalize(cam - P)
+        if N.dot(V) <= 0.0:
+            out[j, i, 0] = ti.u8(0)
+            out[j, i, 1] = ti.u8(0)
+            out[j, i, 2] = ti.u8(0)
+            continue
+
+        surf_col = sphere_col[nearest_idx]
+        ambient = 0.05 * surf_col
+        cr, cg, cb = ambient[0], ambient[1], ambient[2]
+        shadow_bits = 0
+        if shadows_on and shadow_mode == SHADOW_REUSE:
+            shadow_bits = ti.cast(mask[j, i], ti.i32)
+
+        for Lidx in range(num_lights):
+            Lpos = light_pos[Lidx]
+            Lvec = Lpos - P
+            dist = Lvec.norm()
+            if dist < 1e-6:
+                continue
+            L = Lvec / dist
 
-                # Shadow
-                in_shadow = False
-                if shadows_on:
+            dot_nl = N.dot(L)
+            if dot_nl <= 0.0:
+                continue
+
+            H = normalize(L + V)
+
+            # Shadow
+            in_shadow = False
+            if shadows_on:
+                if shadow_mode == SHADOW_REUSE:
+                    in_shadow = (shadow_bits >> Lidx) & 1 == 1
+                else:
                     eps = 1e-3
                     shadow_o = P + eps * N
-                    shadow_dir = L
-                    for s2 in range(num_spheres):
-                        if s2 == nearest_idx:
-                            continue
-                        t_sh = intersect_sphere(shadow_o, shadow_dir, s2)
-                        if t_sh > 0.0 and t_sh < dist - 1e-6:
-                            in_shadow = True
-                            break
-                if in_shadow:
-                    continue
+                    in_shadow = occluded(shadow_o, L, dist - 1e-6, nearest_idx)
+                    if in_shadow:
+                        shadow_bits |= 1 << Lidx
+            if in_shadow:
+                continue
+
+            diff = kd * dot_nl
+            spec = ks * (max(N.dot(H), 0.0) ** shininess)
+            attenuation = light_I0[Lidx] / (dist * dist + 1e-6)
+            Lcol = light_col[Lidx]
+
+            diffuse = diff * attenuation * surf_col * Lcol
+            specular = spec * attenuation * Lcol
+
+            cr += diffuse[0] + specular[0]
+            cg += diffuse[1] + specular[1]
+            cb += diffuse[2] + specular[2]
+
+        if shadows_on and shadow_mode == SHADOW_STORE:
+            mask[j, i] = ti.cast(shadow_bits, ti.u8)
+
+        # перевод в 0..255 с отбрасыванием дробной части — как прежний np.clip(x * 255).astype(uint8)
+        out[j, i, 0] = ti.cast(min(max(cr, 0.0), 1.0) * 255.0, ti.u8)
+        out[j, i, 1] = ti.cast(min(max(cg, 0.0), 1.0) * 255.0, ti.u8)
+        out[j, i, 2] = ti.cast(min(max(cb, 0.0), 1.0) * 255.0, ti.u8)
+
+
+class ShadowCache:
+    """Маска теней последнего полного кадра (бит на источник) и ключ, при котором она верна.
+
+    Тени зависят только от сфер, положений источников, камеры и разрешения, поэтому
+    при смене kd, ks, shininess (а также силы и цвета источников) маска берётся готовой
+    и лучи теней не трассируются вовсе. Ключ — положения источников и камера,
+    сферы сбрасывают маску при загрузке (upload_spheres).
+    """
+
+    def __init__(self):
+        self.key = None
+        self.mask = np.zeros((1, 1), dtype=np.uint8)
+        self.hits = 0
 
-                diff = kd * dot_nl
-                spec = ks * (max(N.dot(H), 0.0) ** shininess)
-                attenuation = light_I0[Lidx] / (dist * dist + 1e-6)
-                Lcol = light_col[Lidx]
+    def invalidate(self):
+        self.key = None
 
-                diffuse = diff * attenuation * surf_col * Lcol
-                specular = spec * attenuation * Lcol
+    def begin(self, key, Wres, Hres):
+        """Режим маски для кадра: SHADOW_REUSE, если маска с этим ключом готова, иначе SHADOW_STORE;
+        key = None (тени выключены или маска не нужна) — SHADOW_TRACE, маска не трогается"""
+        if key is None:
+            return SHADOW_TRACE
+        if key == self.key and self.mask.shape == (Hres, Wres):
+            self.hits += 1
+            return SHADOW_REUSE
+        self.key = None  # пока кадр не досчитан, маска неполная
+        if self.mask.shape != (Hres, Wres):
+            self.mask = np.zeros((Hres, Wres), dtype=np.uint8)
+        return SHADOW_STORE
 
-                cr += diffuse[0] + specular[0]
-                cg += diffuse[1] + specular[1]
-                cb += diffuse[2] + specular[2]
+    def finish(self, key, mode):
+        if mode == SHADOW_STORE:
+            self.key = key
 
-            out[j, i, 0] = min(max(cr, 0.0), 1.0)
-            out[j, i, 1] = min(max(cg, 0.0), 1.0)
-            out[j, i, 2] = min(max(cb, 0.0), 1.0)
 
+shadow_cache = ShadowCache()
 
-def render_scene_to_image(Wres, Hres):
+
+def render_target(Wres, Hres):
+    """Буфер кадра, общий для всех кадров; пересоздаётся только при смене разрешения"""
     global img_field, IMG_W, IMG_H
+    if img_field is None or (IMG_W, IMG_H) != (Wres, Hres):
+        img_field = np.zeros((Hres, Wres, 3), dtype=np.uint8)
+        IMG_W, IMG_H = Wres, Hres
+    return img_field
+
+
+def render_scene_to_image(Wres, Hres, shadow_key=None):
+    """shadow_key — см. ShadowCache; None — тени трассируются заново без маски"""
+    out = render_target(Wres, Hres)
+
+    mode = shadow_cache.begin(shadow_key, Wres, Hres)
+    render_kernel(Wres, Hres, float(Wres), float(Hres), float(SCREEN_Z), 1, 0, out, mode, shadow_cache.mask)
+    shadow_cache.finish(shadow_key, mode)
+
+    # fromarray для RGB копирует данные — картинка не меняется вместе с буфером следующего кадра
+    return Image.fromarray(out, mode='RGB')
+
+
+PROGRESSIVE_STEPS = (8, 4, 2, 1)
+SAVE_POLL_MS = 100  # как часто окно забирает итоги фоновой записи PNG
 
-    out_np = np.zeros((Hres, Wres, 3), dtype=np.float32)
 
-    render_kernel(Wres, Hres, float(Wres), float(Hres), float(SCREEN_Z), out_np)
+def iter_render_progressive(Wres, Hres, steps=PROGRESSIVE_STEPS, shadow_key=None):
+    """Прогрессивный рендер: каждый 8-й пиксель по обеим осям, потом 4-й, 2-й и все.
 
-    maxv = out_np.max()
-    if maxv <= 0:
-        maxv = 1.0
-    img8 = np.clip((out_np) * 255.0, 0, 255).astype(np.uint8)
-    pil = Image.fromarray(img8, mode='RGB')
-    return pil
+    Грубые уровни считают настоящие пиксели полного кадра, следующий уровень
+    досчитывает только недостающие. Отдаёт (шаг, PIL-превью с NEAREST-растяжкой).
+    """
+    out = render_target(Wres, Hres)
+    # маска заполняется по уровням и считается готовой только после последнего
+    mode = shadow_cache.begin(shadow_key, Wres, Hres)
+    coarse = 0
+    for s in steps:
+        render_kernel(Wres, Hres, float(Wres), float(Hres), float(SCREEN_Z), s, coarse, out,
+                      mode, shadow_cache.mask)
+        coarse = s
+        if s == 1:
+            shadow_cache.finish(shadow_key, mode)
+            yield s, Image.fromarray(out, mode='RGB')
+        else:
+            preview = out[::s, ::s].repeat(s, axis=0).repeat(s, axis=1)[:Hres, :Wres]
+            yield s, Image.fromarray(preview, mode='RGB')
 
 
 class LR5App:
@@ -287,6 +609,18 @@ class LR5App:
         self.Wres = tk.IntVar(value=800)
         self.Hres = tk.IntVar(value=800)
         self.shadows = tk.BooleanVar(value=True)
+        self.progressive = tk.BooleanVar(value=True)
+        self.use_bvh = tk.BooleanVar(value=True)
+        self.scene = SceneBuffer()
+        self.scene.set_spheres(self.spheres)
+        self._render_gen = 0
+        # один поток: кадры пишутся по порядку, последний сохранённый — последний показанный
+        self.png_writer = ThreadPoolExecutor(max_workers=1)
+        # поток записи Tk не трогает: итоги (путь, ошибка) идут в очередь, её опрашивает окно
+        self.save_results = queue.Queue()
+        self._saves_pending = 0
+        self._save_poll_id = None
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
 
         # camera vars
         self.cam_x = tk.DoubleVar(value=448.0)
@@ -422,8 +756,11 @@ class LR5App:
         ttk.Separator(f, orient='horizontal').pack(fill='x', pady=6)
         ttk.Label(f, text="Shadows").pack(anchor='w')
         ttk.Checkbutton(f, text="Учитывать тени", variable=self.shadows).pack(anchor='w')
+        ttk.Checkbutton(f, text="BVH по сферам (иначе перебор всех)", variable=self.use_bvh).pack(anchor='w')
 
         ttk.Separator(f, orient='horizontal').pack(fill='x', pady=6)
+        ttk.Checkbutton(f, text="Прогрессивный рендер (1/8 → 1/4 → 1/2 → 1)",
+                        variable=self.progressive).pack(anchor='w')
         ttk.Label(f, text="Image resolution").pack(anchor='w')
         resf = ttk.Frame(f);
         resf.pack(anchor='w')
@@ -447,6 +784,7 @@ class LR5App:
             messagebox.showwarning("Limit", f"Max spheres ({MAX_SPHERES}) reached.")
             return
         self.spheres.append({"pos": pos, "R": Rv, "col": col})
+        self.scene.set_spheres(self.spheres)
         self.refresh_spheres_listbox()
 
     def refresh_spheres_listbox(self):
@@ -464,6 +802,7 @@ class LR5App:
             return
         idx = sel[0]
         del self.spheres[idx]
+        self.scene.set_spheres(self.spheres)
         self.refresh_spheres_listbox()
 
     def apply_lights_from_text(self):
@@ -476,44 +815,15 @@ class LR5App:
         messagebox.showinfo("Lights", f"Applied {len(self.lights)} lights.")
 
     def sync_scene_to_taichi(self):
-        n = len(self.spheres)
-        n = clamp(n, 0, MAX_SPHERES)
-        sphere_active[None] = n
-        for i in range(MAX_SPHERES):
-            if i < n:
-                s = self.spheres[i]
-                sphere_pos[i] = ti.Vector(list(s["pos"]))
-                sphere_rad[i] = float(s["R"])
-                col = s["col"]
-                sphere_col[i] = ti.Vector(list(col))
-            else:
-                sphere_pos[i] = ti.Vector([0.0, 0.0, 0.0])
-                sphere_rad[i] = 0.0
-                sphere_col[i] = ti.Vector([0.0, 0.0, 0.0])
-
-        # lights
-        m = len(self.lights)
-        m = clamp(m, 0, MAX_LIGHTS)
-        light_active[None] = m
-        for i in range(MAX_LIGHTS):
-            if i < m:
-                L = self.lights[i]
-                light_pos[i] = ti.Vector(list(L["pos"]))
-                light_I0[i] = float(L["I0"])
-                light_col[i] = ti.Vector(list(L["col"]))
-            else:
-                light_pos[i] = ti.Vector([0.0, 0.0, 0.0])
-                light_I0[i] = 0.0
-                light_col[i] = ti.Vector([0.0, 0.0, 0.0])
-
-        kd_field[None] = float(self.kd.get())
-        ks_field[None] = float(self.ks.get())
-        shininess_field[None] = float(self.shininess.get())
-        shadows_field[None] = 1 if self.shadows.get() else 0
-
-        cam_x_field[None] = float(self.cam_x.get())
-        cam_y_field[None] = float(self.cam_y.get())
-        cam_z_field[None] = float(self.cam_z.get())
+        """Переносит состояние окна в SceneBuffer и загружает в Taichi только изменившееся.
+
+        Сферы попадают в буфер при добавлении и удалении (set_spheres), остальное сверяется здесь.
+        """
+        self.scene.set_lights(self.lights)
+        self.scene.set_material(float(self.kd.get()), float(self.ks.get()), float(self.shininess.get()),
+                                self.shadows.get(), self.use_bvh.get())
+        self.scene.set_camera(float(self.cam_x.get()), float(self.cam_y.get()), float(self.cam_z.get()))
+        return self.scene.upload()
 
     def render_and_update(self):
         try:
@@ -531,20 +841,78 @@ class LR5App:
             messagebox.showerror("Resolution", "Wrong resolution.")
             return
 
-        pil = render_scene_to_image(W, H)
-        self.last_image = pil
-        pil.save("АКГ_лр5_сферы_taichi.png")
-        print("Saved АКГ_лр5_сферы_taichi.png")
+        # новый запрос бросает незаконченную прогрессивную цепочку
+        self._render_gen += 1
+        key = self.shadow_key()
+        if self.progressive.get():
+            self.render_level(self._render_gen, iter_render_progressive(W, H, shadow_key=key))
+        else:
+            self.finish_render(render_scene_to_image(W, H, shadow_key=key))
+
+    def shadow_key(self):
+        """От чего зависят тени, кроме сфер: положения источников и камера; без теней — None"""
+        if not self.shadows.get():
+            return None
+        lights = tuple(tuple(float(v) for v in L["pos"]) for L in self.lights[:MAX_LIGHTS])
+        return lights, (float(self.cam_x.get()), float(self.cam_y.get()), float(self.cam_z.get()))
+
+    def render_level(self, gen, levels):
+        """Считает один уровень и планирует следующий через after, чтобы окно успевало отвечать"""
+        if gen != self._render_gen:
+            return
+        step, pil = next(levels)
+        if step == 1:
+            self.finish_render(pil)
+            return
+        self.show_image(pil)
+        self.canvas_label.update_idletasks()
+        self.root.after(1, self.render_level, gen, levels)
 
+    def finish_render(self, pil):
+        self.last_image = pil
+        self.show_image(pil)
+        # автосохранение кадра — в фоновом потоке, чтобы не задерживать показ
+        path = "АКГ_лр5_сферы_taichi.png"
+        fut = self.png_writer.submit(pil.save, path)
+        fut.add_done_callback(lambda f: self.save_results.put((path, f.exception())))
+        self._saves_pending += 1
+        if self._save_poll_id is None:
+            self._save_poll_id = self.root.after(SAVE_POLL_MS, self.poll_saves)
+
+    def poll_saves(self):
+        """Итоги фоновой записи PNG — в цикле Tk; об ошибке сообщает messagebox"""
+        self._save_poll_id = None
+        while True:
+            try:
+                path, err = self.save_results.get_nowait()
+            except queue.Empty:
+                break
+            self._saves_pending -= 1
+            if err is not None:
+                messagebox.showerror("Save", f"Could not save {path}: {err}")
+        if self._saves_pending:
+            self._save_poll_id = self.root.after(SAVE_POLL_MS, self.poll_saves)
+
+    def close(self):
+        if self._save_poll_id is not None:
+            self.root.after_cancel(self._save_poll_id)
+            self._save_poll_id = None
+        # окно не ждёт записи: поток не daemon и допишет поставленные кадры после destroy,
+        # а Tk ему для этого не нужен
+        self.png_writer.shutdown(wait=False)
+        self.root.destroy()
+
+    def show_image(self, pil):
+        W, H = pil.size
         vw = self.view.winfo_width() or 800
         vh = self.view.winfo_height() or 600
         max_side = min(vw - 20, vh - 20, 900)
         scale = min(max_side / max(W, H), 1.0) if max(W, H) != 0 else 1.0
         if scale <= 0:
             scale = 1.0
-        disp_w = int(W * scale)
-        disp_h = int(H * scale)
-        im_disp = pil.resize((max(1, disp_w), max(1, disp_h)), Image.NEAREST)
+        disp_w = max(1, int(W * scale))
+        disp_h = max(1, int(H * scale))
+        im_disp = pil if (disp_w, disp_h) == (W, H) else pil.resize((disp_w, disp_h), Image.NEAREST)
         photo = ImageTk.PhotoImage(im_disp)
         self.canvas_label.config(image=photo)
         self.canvas_label.image = photo